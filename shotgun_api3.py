@@ -142,20 +142,51 @@ v1.1 - 2009 Mar 27
 # ---------------------------------------------------------------------------------------------
 # Imports
 # ---------------------------------------------------------------------------------------------
+import array
+import calendar
 import cookielib
+import copy
+import cPickle
 import cStringIO
+import gc
+import getpass
+import keyword
 import mimetools
 import mimetypes
 import os
 import platform
+import Queue
 import re
 import stat
 import sys
+import tempfile
+import threading
 import time
 import urllib
 import urllib2
 from urlparse import urlparse
 
+try:
+    import sqlite3
+except ImportError:
+    try:
+        from pysqlite2 import dbapi2 as sqlite3
+    except ImportError:
+        sqlite3 = None # ShotgunReplica not available
+
+try:
+    import numpy
+except ImportError:
+    numpy = None # find_columns() falls back to array.array and lists
+
+try:
+    import json
+except ImportError:
+    try:
+        import simplejson as json
+    except ImportError:
+        json = None # JsonCodec not available
+
 # ---------------------------------------------------------------------------------------------
 # Shotgun Object
 # ---------------------------------------------------------------------------------------------
@@ -166,9 +197,68 @@ class Shotgun(object):
     # when getting lots of results back.  doesn't affect the interface of the api at all (you always get the full set
     # of results back as one array) but just how the client class communicates with the server.
     records_per_page = 500
+    # Identical read requests (find(), schema reads...) made at the same time from several threads, through any
+    # Shotgun object connected to the same server as the same script and decoding results the same way
+    # (convert_datetimes_to_utc, share_values...), are sent to the server once and everyone waiting gets a copy of
+    # the result.
+    coalesce_reads = True
+    # Number of connections find() may use at once to fetch the remaining pages of a large result set in parallel,
+    # once the first page has told us how many entities there are.  Set to 1 to always fetch pages one at a time.
+    connection_pool_size = 4
+    # Thumbnail urls are looked up in parallel for all the records of a result, and remembered for
+    # thumbnail_url_ttl seconds.  No more than thumbnail_url_max_entries are kept; the oldest are forgotten first.
+    thumbnail_url_ttl = 300
+    thumbnail_url_max_entries = 10000
+    # With lazy_thumbnail_urls on, 'image' values in results are LazyThumbnailUrl objects, and the thumbnail urls are
+    # only looked up (for the whole result at once) when one of them is first used as a string.
+    lazy_thumbnail_urls = False
+    # With adaptive_paging on, find() times every page it reads and moves the page size used for that entity type
+    # and set of fields towards one that takes adaptive_page_secs and returns no more than adaptive_page_max_bytes,
+    # staying within adaptive_page_range.  The tuned sizes are kept for the life of the Shotgun object.
+    adaptive_paging = False
+    adaptive_page_secs = 2.0
+    adaptive_page_max_bytes = 8 * 1024 * 1024
+    adaptive_page_range = (50, 5000)
+    # Entity links that are the same within a response ({'type', 'id'} or {'type', 'id', 'name'} dicts) are decoded as
+    # one dict shared by every record that links to it, and field names and short strings are only kept once.  With
+    # share_values_across_responses on, they're also shared with every other response read by the same Shotgun
+    # object.  Turn share_values off if your code modifies link dicts in results in place.  Both take effect for
+    # Shotgun objects created after they're set.
+    share_values = True
+    share_values_across_responses = False
+    # Requests bigger than stream_request_bytes (large batch(), create() or update() calls) are written to the
+    # connection as they're marshalled instead of being built in memory first, so sending them takes no more memory
+    # than a small one.  Their length is worked out with an extra marshalling pass, unless chunked_requests is on and
+    # they're sent with chunked transfer encoding, which the server and any proxy in between have to accept.
+    stream_request_bytes = 1024 * 1024
+    chunked_requests = False
+    # With pause_gc_while_decoding on, the cyclic garbage collector is paused while responses are decoded, as all it
+    # would find are the new results.  The collector is process wide, so don't turn this on if requests can be made
+    # from several threads at once (including find() fetching pages in parallel): the first to finish turns the
+    # collector back on while the others are still decoding.  It's left alone if something else has turned it off.
+    pause_gc_while_decoding = False
+    # Field schemas read with schema_read() and schema_field_read() are kept for schema_expire_mins minutes, in memory
+    # and in a file per server in schema_cache_dir (by default a directory of your own under the system temp dir),
+    # which every script you run on the machine shares.  A directory that isn't yours, or that others can write to,
+    # isn't used.  Creating, updating or deleting fields through the API drops the schema of that entity type.  Set
+    # schema_cache_dir to False to keep schemas in memory only, or schema_expire_mins to 0 to always read them from
+    # the server.
     schema_expire_mins = 60
-    
-    def __init__(self, base_url, script_name, api_key, convert_datetimes_to_utc=True, http_proxy=None):
+    schema_cache_dir = None
+    # Format requests and responses are sent in: 'xmlrpc', which every server speaks, or 'json', which is several
+    # times smaller and quicker to decode but needs a server with the /api3/json endpoint.  Results are the same
+    # either way.  JSON has no datetime type, so the schema of each entity type is read (or taken from the schema
+    # cache) before its first request, and the values of its date_time fields are turned into datetimes.  It can
+    # also be chosen for each Shotgun object with the wire_format argument.
+    wire_format = 'xmlrpc'
+    # Responses are asked for gzip or deflate compressed, and decompressed as they arrive.  Requests bigger than
+    # compress_request_bytes, and every request big enough to be streamed, are sent gzip compressed, which the
+    # server has to accept; it's off (None) by default.
+    compress_responses = True
+    compress_request_bytes = None
+    
+    def __init__(self, base_url, script_name, api_key, convert_datetimes_to_utc=True, http_proxy=None,
+                 wire_format=None):
         """
         Initialize Shotgun.
         """
@@ -184,16 +274,27 @@ class Shotgun(object):
         self.convert_datetimes_to_utc = convert_datetimes_to_utc
         self.sid = None # only load this if needed
         self.http_proxy = http_proxy
+        self.session_uuid = None
+        self._decode_memo = DecodeMemo()
+        # field data types seen in schema reads, {entity_type: {field_name: data_type}}
+        self._schema_field_types = {}
+        if wire_format is not None:
+            self.wire_format = wire_format
+        if self.wire_format not in ('xmlrpc', 'json'):
+            raise ShotgunError("Invalid wire_format '%s'.  Use 'xmlrpc' or 'json'." % (self.wire_format))
+        if self.wire_format == 'json' and json is None:
+            raise ShotgunError("wire_format 'json' needs the json (or simplejson) module.")
         
-        server_options = {
-            'server_url': self.api_url,
-            'script_name': self.script_name,
-            'script_key': self.api_key,
-            'http_proxy' : self.http_proxy,
-            'convert_datetimes_to_utc': self.convert_datetimes_to_utc
-        }
-        
-        self._api3 = ShotgunCRUD(server_options)
+        self._api3 = self._make_crud()
+        self._api3_pool = ConnectionPool(self._make_crud)
+        self._http_pool = ConnectionPool(self._make_http_connection)
+        self._thumb_urls = {}
+        self._thumb_urls_lock = threading.Lock()
+        self._page_sizes = {}
+        self._page_sizes_lock = threading.Lock()
+        self.schema_cache = self._make_schema_cache()
+        # set to a ResultCache to cache the results of find() and find_one() in memory
+        self.result_cache = None
         
         self.server_info = self._api3.info()
         self._determine_features()
@@ -203,6 +304,22 @@ class Shotgun(object):
         if self.platform:
             self.local_path_string = "local_path_%s" % (self.platform)
     
+    def _make_schema_cache(self):
+        if not self.schema_expire_mins:
+            return None
+        
+        path = None
+        if self.schema_cache_dir is not False:
+            cache_dir = self.schema_cache_dir
+            if cache_dir is None:
+                try:
+                    user = getpass.getuser()
+                except Exception:
+                    user = "shotgun"
+                cache_dir = os.path.join(tempfile.gettempdir(), "shotgun_api3_%s" % (user))
+            path = os.path.join(cache_dir, "schema_%s.xml" % (re.sub(r"[^\w.-]+", "_", self.base_url)))
+        return SchemaCache(path, self.schema_expire_mins)
+    
     def _determine_features(self):
         self.supports_paging_info = False
         
@@ -226,7 +343,71 @@ class Shotgun(object):
                 return s
         return None
     
-    def _inject_field_values(self, records):
+    def _field_data_type(self, entity_type, field_name):
+        """
+        Returns the data type of a field as reported by the last schema read of its entity type, following
+        linked field paths such as 'sg_sequence.Sequence.code', or None when it isn't known.
+        """
+        parts = field_name.split('.')
+        while len(parts) >= 3:
+            entity_type = parts[1]
+            parts = parts[2:]
+        if len(parts) != 1:
+            return None
+        if entity_type not in self._schema_field_types and self.schema_cache is not None:
+            fields = self.schema_cache.get(entity_type)
+            if fields is not None:
+                self._remember_field_types(entity_type, fields)
+        return self._schema_field_types.get(entity_type, {}).get(parts[0])
+    
+    def _remember_field_types(self, entity_type, fields):
+        types = {}
+        for field_name, properties in fields.items():
+            try:
+                types[field_name] = properties['data_type']['value']
+            except (KeyError, TypeError):
+                pass
+        self._schema_field_types[entity_type] = types
+    
+    def _need_field_types(self, entity_type, fields=()):
+        """
+        With wire_format 'json', reads the schema of entity_type, and of the entity types linked field paths in
+        fields go through, if their field types aren't known yet.  Responses tell datetimes from strings by them.
+        """
+        if self.wire_format != 'json':
+            return
+        entity_types = [entity_type]
+        for f in fields:
+            parts = f.split('.')
+            while len(parts) >= 3:
+                entity_types.append(parts[1])
+                parts = parts[2:]
+        for entity_type in entity_types:
+            if entity_type not in self._schema_field_types:
+                # takes them from the schema cache if it has them
+                self._field_data_type(entity_type, 'id')
+                if entity_type not in self._schema_field_types:
+                    self.schema_field_read(entity_type)
+    
+    def _injection_plan(self, entity_type, fields):
+        """
+        Works out which of the fields returned for entity_type may need values injected by _inject_field_values().
+        Returns (thumbnails, local_fields) where thumbnails is True when 'image' is one of the fields, and
+        local_fields lists the fields that may hold local file links: url fields, or fields whose type we don't
+        know yet.
+        """
+        thumbnails = 'image' in fields
+        local_fields = []
+        if self.platform:
+            for field_name in fields:
+                if field_name in ('id', 'type', 'image') or field_name in local_fields:
+                    continue
+                data_type = self._field_data_type(entity_type, field_name)
+                if data_type is None or data_type == 'url':
+                    local_fields.append(field_name)
+        return (thumbnails, local_fields)
+    
+    def _inject_field_values(self, records, entity_type=None, fields=None):
         """
         Inject additional information into server results for convenience before returning
         records back to the client. Currently this includes:
@@ -234,25 +415,60 @@ class Shotgun(object):
         - any local file link fields
             'local_file' key is set to match the current platform's path
             'url' key is set to match the current platform's url
+        
+        When the fields returned are known, only the fields in the injection plan for them are
+        looked at, and records are not looked at at all when no field can need injecting.  Records
+        of mixed types (batch) are planned per type with entity_type None.
         """
         if len(records) == 0:
             return records
         
-        for i,r in enumerate(records):
+        plans = {}
+        if fields is not None:
+            fields = list(fields)
+            if entity_type is not None:
+                plan = self._injection_plan(entity_type, fields)
+                if not plan[0] and not plan[1]:
+                    return records
+                plans[entity_type] = plan
+        
+        # look up all the thumbnail urls at once
+        thumbs = []
+        for r in records:
+            if type(r) is dict and r.get('image'):
+                thumbs.append((r['type'], r['id']))
+        if thumbs and self.lazy_thumbnail_urls:
+            thumb_batch = _ThumbnailBatch(self, thumbs)
+        elif thumbs:
+            thumb_urls = self._get_thumb_urls(thumbs)
+        
+        for r in records:
             # skip results that aren't entity dictionaries
             if type(r) is not dict:
                 continue
             
-            # iterate over each item and check each field for possible injection
-            for k, v in r.items():
-                # check for thumbnail
-                if k == 'image' and v:
-                    records[i]['image'] = self._get_thumb_url(r['type'], r['id'])
-                
-                if type(v) == dict and 'link_type' in v and v['link_type'] == 'local' \
-                    and self.platform and self.local_path_string in r[k]:
-                    records[i][k]['local_path'] = r[k][self.local_path_string]
-                    records[i][k]['url'] = "file://%s" % (r[k]['local_path'])
+            if fields is None:
+                # no plan, check every field of the record for possible injection
+                thumbnails, local_fields = ('image' in r, r.keys())
+            else:
+                record_type = entity_type or r.get('type')
+                if record_type not in plans:
+                    plans[record_type] = self._injection_plan(record_type, fields)
+                thumbnails, local_fields = plans[record_type]
+            
+            # check for thumbnail
+            if thumbnails and r.get('image') and self.lazy_thumbnail_urls:
+                r['image'] = LazyThumbnailUrl(thumb_batch, (r['type'], r['id']))
+            elif thumbnails and r.get('image'):
+                r['image'] = thumb_urls[(r['type'], r['id'])]
+            
+            if not self.platform:
+                continue
+            for k in local_fields:
+                v = r.get(k)
+                if type(v) == dict and v.get('link_type') == 'local' and self.local_path_string in v:
+                    v['local_path'] = v[self.local_path_string]
+                    v['url'] = "file://%s" % (v['local_path'])
         
         return records
     
@@ -261,48 +477,187 @@ class Shotgun(object):
         Returns the URL for the thumbnail of an entity given the
         entity type and the entity id
         """
-        url = self.base_url + "/upload/get_thumbnail_url?entity_type=%s&entity_id=%d"%(entity_type,entity_id)
+        return self._get_thumb_urls([(entity_type, entity_id)])[(entity_type, entity_id)]
+    
+    def _get_thumb_urls(self, entities):
+        """
+        Returns a dict mapping each of the given (entity type, entity id) tuples to the URL of its thumbnail.
+        URLs that aren't already known are requested in parallel over keep-alive connections, and are remembered for
+        thumbnail_url_ttl seconds.
+        """
+        now = time.time()
+        urls = {}
+        missing = []
+        self._thumb_urls_lock.acquire()
+        try:
+            for key in entities:
+                cached = self._thumb_urls.get(key)
+                if cached and cached[0] > now:
+                    urls[key] = cached[1]
+                elif key not in urls:
+                    urls[key] = None
+                    missing.append(key)
+        finally:
+            self._thumb_urls_lock.release()
+        
+        if missing:
+            fetched = self._http_pool.map(self._fetch_thumb_url, missing, self.connection_pool_size)
+            expires = time.time() + self.thumbnail_url_ttl
+            self._thumb_urls_lock.acquire()
+            try:
+                for key, url in zip(missing, fetched):
+                    urls[key] = url
+                    self._thumb_urls[key] = (expires, url)
+                self._trim_thumb_urls(time.time())
+            finally:
+                self._thumb_urls_lock.release()
+        
+        return urls
+    
+    def _trim_thumb_urls(self, now):
+        # called with _thumb_urls_lock held.  drops the expired urls, then the ones that expire first until no more
+        # than thumbnail_url_max_entries are left
+        thumb_urls = self._thumb_urls
+        for key, (expires, url) in thumb_urls.items():
+            if expires <= now:
+                del thumb_urls[key]
+        excess = len(thumb_urls) - self.thumbnail_url_max_entries
+        if excess > 0:
+            oldest = [(expires, key) for key, (expires, url) in thumb_urls.items()]
+            oldest.sort()
+            for expires, key in oldest[:excess]:
+                del thumb_urls[key]
+    
+    def _fetch_thumb_url(self, conn, key):
+        entity_type, entity_id = key
+        path = "/upload/get_thumbnail_url?entity_type=%s&entity_id=%d" % (entity_type, entity_id)
         for i in range(3):
-            f = urllib.urlopen(url)
-            response_code = f.readline().strip()
+            lines = self._http_get(conn, path).split("\n", 2)
+            response_code = lines[0].strip()
             # something else happened. try again. found occasional connection errors still spit out html but not
             # the correct response codes. usually trying again will right the ship. if not, we catch for it later.
             if response_code not in ('0','1'):
                 continue
             elif response_code == '1':
-                path = f.readline().strip()
-                if path:
-                    return self.base_url + path
+                if len(lines) > 1 and lines[1].strip():
+                    return self.base_url + lines[1].strip()
             elif response_code == '0':
                 break
         # if it's an error, message is printed on second line
-        raise ValueError, "%s:%s " % (entity_type,entity_id)+f.read().strip()
+        raise ValueError, "%s:%s " % (entity_type,entity_id)+"\n".join(lines[1:]).strip()
     
-    def set_session_uuid(self, session_uuid):
+    def _make_http_connection(self):
+        """
+        Create a keep-alive http connection to the server for requests outside of the api, or return None when
+        a proxy is in use, in which case _http_get() goes through urllib instead.
+        """
+        scheme, host = urlparse(self.base_url)[0:2]
+        if self.http_proxy or scheme in urllib.getproxies():
+            return None
+        if scheme == "https":
+            return httplib.HTTPSConnection(host)
+        return httplib.HTTPConnection(host)
+    
+    def _http_get(self, conn, path):
+        """
+        GET a path on the server through a connection from _make_http_connection(), and return the response body.
+        """
+        if conn is None:
+            f = urllib.urlopen(self.base_url + path)
+            try:
+                return f.read()
+            finally:
+                f.close()
+        
+        try:
+            conn.request("GET", path)
+            return conn.getresponse().read()
+        except (socket.error, httplib.HTTPException):
+            # the server may have closed the connection while it was idle, so try once more on a new one
+            conn.close()
+            conn.request("GET", path)
+            return conn.getresponse().read()
+    
+    def _make_crud(self):
+        """
+        Create a new connection to the server using the settings of this instance.
+        """
         server_options = {
             'server_url': self.api_url,
             'script_name': self.script_name,
             'script_key': self.api_key,
             'http_proxy' : self.http_proxy,
-            'convert_datetimes_to_utc': self.convert_datetimes_to_utc,
-            'session_uuid': session_uuid
+            'convert_datetimes_to_utc': self.convert_datetimes_to_utc
         }
+        if self.session_uuid:
+            server_options['session_uuid'] = self.session_uuid
+        if self.coalesce_reads:
+            server_options['single_flight'] = _read_flights
+        server_options['share_values'] = self.share_values
+        server_options['stream_request_bytes'] = self.stream_request_bytes
+        server_options['chunked_requests'] = self.chunked_requests
+        server_options['pause_gc'] = self.pause_gc_while_decoding
+        server_options['wire_format'] = self.wire_format
+        server_options['field_types'] = self._schema_field_types
+        server_options['compress_responses'] = self.compress_responses
+        server_options['compress_request_bytes'] = self.compress_request_bytes
+        if self.share_values_across_responses:
+            server_options['decode_memo'] = self._decode_memo
         
-        self._api3 = ShotgunCRUD(server_options)
+        return ShotgunCRUD(server_options)
+    
+    def set_session_uuid(self, session_uuid):
+        self.session_uuid = session_uuid
+        self._api3 = self._make_crud()
+        self._api3_pool = ConnectionPool(self._make_crud)
     
     def schema_read(self):
+        if self.schema_cache is not None:
+            schema = self.schema_cache.get_all()
+            if schema is not None:
+                return schema
+        
         resp = self._api3.schema_read()
+        for entity_type, fields in resp["results"].items():
+            self._remember_field_types(entity_type, fields)
+        if self.schema_cache is not None:
+            self.schema_cache.set_all(resp["results"])
         return resp["results"]
     
     def schema_field_read(self, entity_type, field_name=None):
+        """
+        Returns the schema of all the fields of entity_type, or just of field_name.  The schema of the whole
+        entity type is read and kept in the schema cache either way, so later reads of its other fields are free.
+        """
+        if self.schema_cache is not None:
+            fields = self.schema_cache.get(entity_type)
+            if fields is None:
+                resp = self._api3.schema_field_read({"type":entity_type})
+                fields = resp["results"]
+                self._remember_field_types(entity_type, fields)
+                self.schema_cache.set(entity_type, fields)
+                fields = copy.deepcopy(fields)
+            if not field_name:
+                return fields
+            if field_name in fields:
+                return {field_name: fields[field_name]}
+            # let the server report the missing field
+        
         args = {
             "type":entity_type
         }
         if field_name:
             args["field_name"] = field_name
         resp = self._api3.schema_field_read(args)
+        if not field_name:
+            self._remember_field_types(entity_type, resp["results"])
         return resp["results"]
     
+    def _invalidate_schema(self, entity_type):
+        self._schema_field_types.pop(entity_type, None)
+        if self.schema_cache is not None:
+            self.schema_cache.invalidate(entity_type)
+    
     def schema_field_create(self, entity_type, data_type, display_name, properties=None):
         if properties == None:
             properties = {}
@@ -315,6 +670,7 @@ class Shotgun(object):
         for f,v in properties.items():
             args["properties"].append( {"property_name":f,"value":v} )
         resp = self._api3.schema_field_create(args)
+        self._invalidate_schema(entity_type)
         return resp["results"]
     
     def schema_field_update(self, entity_type, field_name, properties):
@@ -326,6 +682,7 @@ class Shotgun(object):
         for f,v in properties.items():
             args["properties"].append( {"property_name":f,"value":v} )
         resp = self._api3.schema_field_update(args)
+        self._invalidate_schema(entity_type)
         return resp["results"]
     
     def schema_field_delete(self, entity_type, field_name):
@@ -334,13 +691,15 @@ class Shotgun(object):
             "field_name":field_name
         }
         resp = self._api3.schema_field_delete(args)
+        self._invalidate_schema(entity_type)
         return resp["results"]
     
     def schema_entity_read(self):
         resp = self._api3.schema_entity_read()
         return resp["results"]
     
-    def find(self, entity_type, filters, fields=None, order=None, filter_operator=None, limit=0, retired_only=False, page=0):
+    def find(self, entity_type, filters, fields=None, order=None, filter_operator=None, limit=0, retired_only=False, page=0,
+             keyset_paging=False, expand=None, record_format=None):
         """
         Find entities of entity_type matching the given filters.
         
@@ -351,26 +710,160 @@ class Shotgun(object):
         
         Returns an array of dict entities sorted by the optional
         'order' parameter.
+        
+        With keyset_paging, entities are returned in id order and each
+        page asks for the entities with an id greater than the last one
+        seen, instead of a page number.  Every page then costs the server
+        the same however deep into the results it is, and entities created
+        or deleted during the scan can't shift the remaining pages.  A scan
+        that was interrupted can be resumed by adding an
+        ['id', 'greater_than', last_id] filter.  It can't be combined with
+        'order' or 'page'.
+        
+        'expand' fetches fields of linked entities along with the results.
+        It maps entity (or multi-entity) fields to lists of fields to read
+        from the entities they link to, e.g.
+            expand={'entity': ['code', 'sg_status_list']}
+        The linked entities of each type are fetched with a single query
+        once the results are in, and the fields are added to the link
+        dicts in the results.
+        
+        If result_cache is set, results are served from it until they
+        expire or a write to entity_type invalidates them.
+        
+        'record_format' trades dicts for records that take much less
+        memory on large results, and whose fields can be read as with a
+        dict (r['code'], get, has_key, keys, values, items) plus to_dict():
+            'slots'  records are instances of a class made for the fields,
+                     whose values are kept in __slots__.  They behave like
+                     read-only dicts (in, len, iterating over the keys), and
+                     fields whose names are identifiers can also be read as
+                     attributes.
+            'tuple'  records are tuples of the values, in the order of the
+                     field names in r._fields ('type' and 'id' first), one
+                     tuple shared by all the records.  Apart from taking
+                     field names as indexes they're plain tuples.
+        The conversion is done one page at a time as the pages arrive, so
+        the full result never exists as dicts.
+        """
+        cache_key = None
+        if self.result_cache is not None:
+            # the order of the fields doesn't change the results
+            cache_key = self.result_cache.key(entity_type, filters, sorted(fields or ['id']), order, filter_operator,
+                                              limit, retired_only, page, keyset_paging, expand, record_format)
+            found, records = self.result_cache.get(cache_key)
+            if found:
+                return records
+        
+        req = self._find_request(entity_type, filters, fields, order, filter_operator, limit, retired_only, page,
+                                 keyset_paging)
+        finish = self._page_finisher(entity_type, req["return_fields"], record_format)
+        
+        # If page isn't set and the limit doesn't require pagination, then trigger the
+        # faster code path.
+        if limit and limit == req["paging"]["entities_per_page"] and page == 0 and not keyset_paging:
+            page = 1
+        
+        records = []
+        
+        # if page is specified, then only return the page of records requested
+        if type(page) != int or page < 0:
+            raise ValueError("find() 'page' parameter must be a positive integer")
+        elif keyset_paging:
+            last_id = 0
+            remaining = 0
+            done = False
+            while not done:
+                if limit > 0:
+                    remaining = limit - len(records)
+                page_req = self._keyset_page_request(req, last_id, remaining)
+                results = self._read(self._api3, page_req)["results"]["entities"]
+                if finish:
+                    results = finish(results)
+                records.extend(results)
+                if len(results) < page_req["paging"]["entities_per_page"] or len(records) == limit:
+                    done = True
+                else:
+                    last_id = results[-1]["id"]
+        elif page != 0:
+            # No paging_info needed, so optimize it out.
+            if self.supports_paging_info:
+                req["return_paging_info"] = False 
+            
+            req["paging"]["current_page"] = page
+            resp = self._read(self._api3, req)
+            results = resp["results"]["entities"]
+            if finish:
+                results = finish(results)
+            records.extend(results)
+        else:
+            done = False
+            while not done:
+                resp = self._read(self._api3, req)
+                results = resp["results"]["entities"]
+                if results:
+                    if finish:
+                        results = finish(results)
+                    records.extend(results)
+                    entity_count = resp["results"]["paging_info"]["entity_count"]
+                    if ( len(records) >= limit and limit > 0 ):
+                        records = records[:limit]
+                        done = True
+                    elif len(records) == entity_count:
+                        done = True
+                    elif (self.connection_pool_size > 1 and req['paging']['current_page'] == 1 and
+                          self.supports_paging_info and type(entity_count) in (int, long)):
+                        # we know how many pages are left, so fetch them all at once
+                        if limit > 0:
+                            entity_count = min(entity_count, limit)
+                        per_page = req['paging']['entities_per_page']
+                        last_page = (entity_count + per_page - 1) / per_page
+                        records.extend(self._read_pages(req, range(2, last_page + 1), finish))
+                        if limit > 0:
+                            records = records[:limit]
+                        done = True
+                    else:
+                        req['paging']['current_page'] += 1
+                else:
+                    done = True
+        
+        if not finish:
+            records = self._inject_field_values(records, entity_type, req["return_fields"])
+        if expand:
+            records = self._expand_links(records, expand)
+        
+        if cache_key is not None:
+            self.result_cache.set(cache_key, entity_type, records)
+        
+        return records
+    
+    def _page_finisher(self, entity_type, fields, record_format):
+        """
+        Return a function that injects field values into a page of find() results and converts it to
+        record_format, or None when records stay dicts.
+        """
+        if record_format in (None, 'dict'):
+            return None
+        record_class = _record_class(record_format, fields)
+        record_fields = record_class._fields
+        
+        def finish(results):
+            results = self._inject_field_values(results, entity_type, fields)
+            return [record_class([r.get(f) for f in record_fields]) for r in results]
+        return finish
+    
+    def _find_request(self, entity_type, filters, fields, order, filter_operator, limit, retired_only, page=0,
+                      keyset_paging=False):
+        """
+        Build the read request shared by find() and find_iter().
         """
         if fields == None:
             fields = ['id']
         if order == None:
             order = []
         
-        if type(filters) == type([]):
-            new_filters = {}
-            if not filter_operator or filter_operator == "all":
-                new_filters["logical_operator"] = "and"
-            else:
-                new_filters["logical_operator"] = "or"
-            
-            new_filters["conditions"] = []
-            for f in filters:
-                new_filters["conditions"].append( {"path":f[0],"relation":f[1],"values":f[2:]} )
-            
-            filters = new_filters
-        elif filter_operator:
-            raise ShotgunError("Deprecated: Use of filter_operator for find() is not valid any more.  See the documention on find()")
+        filters = self._translate_filters(filters, filter_operator)
+        self._need_field_types(entity_type, fields)
         
         if retired_only:
             return_only = 'retired'
@@ -385,6 +878,10 @@ class Shotgun(object):
             "paging": {"entities_per_page": self.records_per_page, "current_page": 1}
         }
         
+        # a specific page only makes sense with the fixed page size
+        if page == 0:
+            req["paging"]["entities_per_page"] = self._page_size(entity_type, fields)
+        
         if self.supports_paging_info:
             req["return_paging_info"] = True
         
@@ -400,47 +897,406 @@ class Shotgun(object):
         
         if type(limit) != int or limit < 0:
            raise ValueError("find() 'limit' parameter must be a positive integer")
-        elif (limit and limit > 0 and limit <= self.records_per_page):
+        elif (limit and limit > 0 and limit <= req["paging"]["entities_per_page"]):
             req["paging"]["entities_per_page"] = limit
-            
-            # If page isn't set and the limit doesn't require pagination, then trigger the
-            # faster code path.
-            if page == 0:
-                page = 1
         
-        records = []
+        if keyset_paging:
+            if order or page:
+                raise ShotgunError("keyset_paging always returns entities in id order, one page after another.  It "
+                                   "can't be combined with 'order' or 'page'.")
+            req["sorts"] = [{'field_name': 'id', 'direction': 'asc'}]
+            self._skip_paging_info(req)
         
-        # if page is specified, then only return the page of records requested
-        if type(page) != int or page < 0:
-            raise ValueError("find() 'page' parameter must be a positive integer")
-        elif page != 0:
-            # No paging_info needed, so optimize it out.
-            if self.supports_paging_info:
-                req["return_paging_info"] = False 
+        return req
+    
+    def _skip_paging_info(self, req):
+        # the end of the results is detected from a short page, so the total is never needed
+        if self.supports_paging_info:
+            req["return_paging_info"] = False
+    
+    def _translate_filters(self, filters, filter_operator):
+        """
+        Convert a list of [path, relation, values...] filters into the logical_operator/conditions structure the
+        server expects.  Filters that already have that structure are returned as they are.
+        """
+        if type(filters) == type([]):
+            new_filters = {}
+            if not filter_operator or filter_operator == "all":
+                new_filters["logical_operator"] = "and"
+            else:
+                new_filters["logical_operator"] = "or"
             
-            req["paging"]["current_page"] = page
-            resp = self._api3.read(req)
-            results = resp["results"]["entities"]
-            records.extend(results)
+            new_filters["conditions"] = []
+            for f in filters:
+                new_filters["conditions"].append( {"path":f[0],"relation":f[1],"values":f[2:]} )
+            
+            filters = new_filters
+        elif filter_operator:
+            raise ShotgunError("Deprecated: Use of filter_operator for find() is not valid any more.  See the documention on find()")
+        
+        return filters
+    
+    def find_iter(self, entity_type, filters, fields=None, order=None, filter_operator=None, limit=0, retired_only=False,
+                  keyset_paging=False, expand=None, record_format=None, stream_entities=False):
+        """
+        Same as find, but returns a generator that yields the matching entities
+        instead of a list.
+        
+        Entities are requested and have their field values injected one page
+        at a time, and the next page is fetched in the background while the
+        current one is being consumed, so memory use stays flat however many
+        entities match.
+        
+        With stream_entities, entities are yielded as soon as they've been
+        decoded, while the rest of their page is still arriving, instead of
+        once the whole page is in.  The first entities are available much
+        sooner on large pages, but pages are read one after another rather
+        than ahead of time.  It can't be combined with 'expand'.
+        """
+        if stream_entities and expand:
+            raise ShotgunError("find_iter() 'stream_entities' can't be combined with 'expand'")
+        
+        req = self._find_request(entity_type, filters, fields, order, filter_operator, limit, retired_only, 0,
+                                 keyset_paging)
+        finish = self._page_finisher(entity_type, req["return_fields"], record_format)
+        
+        if stream_entities:
+            pages = self._stream_pages(req, limit, keyset_paging)
         else:
-            done = False
-            while not done:
-                resp = self._api3.read(req)
-                results = resp["results"]["entities"]
-                if results:
-                    records.extend(results)
-                    if ( len(records) >= limit and limit > 0 ):
-                        records = records[:limit]
-                        done = True
-                    elif len(records) == resp["results"]["paging_info"]["entity_count"]:
-                        done = True
+            pages = self._iter_pages(req, limit, keyset_paging)
+        for results in pages:
+            if finish:
+                results = finish(results)
+            else:
+                results = self._inject_field_values(results, entity_type, req["return_fields"])
+            if expand:
+                results = self._expand_links(results, expand)
+            for record in results:
+                yield record
+    
+    def _iter_pages(self, req, limit, keyset_paging):
+        """
+        Generator yielding the pages of entities of a read request, as they come from the server.  The next page
+        is fetched in the background while the current one is being consumed.
+        """
+        count = 0
+        page = 1
+        if keyset_paging:
+            page_req = self._keyset_page_request(req, 0, limit)
+        else:
+            page_req = self._page_request(req, page)
+        pending = _BackgroundCall(self._api3_pool.call, self._read, page_req)
+        while pending:
+            results = pending.result()["results"]["entities"]
+            pending = None
+            if limit > 0:
+                results = results[:limit - count]
+            count += len(results)
+            if len(results) == page_req["paging"]["entities_per_page"] and count != limit:
+                page += 1
+                if keyset_paging:
+                    page_req = self._keyset_page_request(req, results[-1]["id"], max(limit - count, 0))
+                else:
+                    page_req = self._page_request(req, page)
+                pending = _BackgroundCall(self._api3_pool.call, self._read, page_req)
+            yield results
+    
+    def _stream_pages(self, req, limit, keyset_paging):
+        """
+        Generator yielding the entities of a read request in lists, as they're decoded from the server's
+        responses.  The pages are read one after another over one connection from the pool, which goes back to
+        the pool when the generator finishes, fails or is closed.
+        """
+        api3 = self._api3_pool.acquire()
+        # True while a response is only partly read
+        reading = False
+        # (python 2.4 can't yield inside try/finally, so the exception handlers do the same job)
+        try:
+            count = 0
+            page = 1
+            if keyset_paging:
+                page_req = self._keyset_page_request(req, 0, limit)
+            else:
+                page_req = self._page_request(req, page)
+            while page_req:
+                page_count = 0
+                last_id = None
+                reading = True
+                for results in api3.stream_read(page_req):
+                    # the rest of a page past the limit is still read, so the connection can be used again
+                    if limit > 0:
+                        results = results[:limit - count]
+                    if results:
+                        count += len(results)
+                        page_count += len(results)
+                        last_id = results[-1]["id"]
+                        yield results
+                reading = False
+                
+                if page_count == page_req["paging"]["entities_per_page"] and count != limit:
+                    page += 1
+                    if keyset_paging:
+                        page_req = self._keyset_page_request(req, last_id, max(limit - count, 0))
                     else:
-                        req['paging']['current_page'] += 1
+                        page_req = self._page_request(req, page)
                 else:
-                    done = True
+                    page_req = None
+        except Fault:
+            # faults come once the whole response has been read
+            self._api3_pool.release(api3)
+            raise
+        except:
+            # the caller stopped early (closing the generator raises GeneratorExit at the yield) or something went
+            # wrong part way through a response, whose unread rest would be in the way of the next request
+            if reading:
+                api3.close()
+            self._api3_pool.release(api3)
+            raise
+        self._api3_pool.release(api3)
+    
+    def find_columns(self, entity_type, filters, fields=None, order=None, filter_operator=None, limit=0,
+                     retired_only=False, keyset_paging=False):
+        """
+        Same as find, but returns the results as columns: a dict mapping
+        'id' and each of the fields to the list of its values, in result
+        order.  The columns are filled one page at a time as the pages
+        arrive, so the results are never all held as dicts.
+        
+        Columns are built according to the data type of the field in the
+        schema (see schema_field_read()).  When numpy is installed:
+            number, percent, duration, timecode   int64 arrays, or float64
+                                                  arrays with NaN for
+                                                  missing values
+            float, currency                       float64 arrays, NaN for
+                                                  missing values
+            date_time                             datetime64[s] arrays in
+                                                  UTC, NaT for missing
+            date                                  datetime64[D] arrays
+        Without numpy, numeric fields are array.array columns (lists when
+        an integer field has missing values), and date and date_time
+        fields are lists.
+        
+        Entity fields are split into two columns, 'field.type' (a list)
+        and 'field.id' (numeric, as above).  Any other field is a list of
+        its values.
+        """
+        req = self._find_request(entity_type, filters, fields, order, filter_operator, limit, retired_only, 0,
+                                 keyset_paging)
+        fields = ['id']
+        for f in req["return_fields"]:
+            if f not in fields:
+                fields.append(f)
+        
+        columns = []
+        for f in fields:
+            data_type = self._column_data_type(entity_type, f)
+            if data_type == 'entity':
+                columns.append((f, _LinkColumn(f)))
+            else:
+                columns.append((f, _column_class(data_type)(f)))
+        
+        for results in self._iter_pages(req, limit, keyset_paging):
+            results = self._inject_field_values(results, entity_type, req["return_fields"])
+            for f, column in columns:
+                column.extend([r.get(f) for r in results])
+        
+        result = {}
+        for f, column in columns:
+            result.update(column.finish())
+        return result
+    
+    def _column_data_type(self, entity_type, field_name):
+        """
+        Returns the data type of a field for find_columns(), reading the schema of the entity type the field
+        belongs to if it isn't known yet.
+        """
+        if field_name == 'id':
+            return 'number'
+        data_type = self._field_data_type(entity_type, field_name)
+        if data_type is None:
+            parts = field_name.split('.')
+            while len(parts) >= 3:
+                entity_type = parts[1]
+                parts = parts[2:]
+            if entity_type not in self._schema_field_types:
+                self.schema_field_read(entity_type)
+                data_type = self._field_data_type(entity_type, parts[0])
+        return data_type
+    
+    def _expand_links(self, records, expand):
+        """
+        Fetch the fields listed in 'expand' for the entities linked from records, with one query per linked entity
+        type, and return the records with those fields added to copies of their link dicts.  The decoded link dicts
+        themselves may be shared with other results, so they're never changed.
+        """
+        def is_link(value):
+            return type(value) is dict and 'type' in value and 'id' in value
+        
+        # entity type => fields to read, and entity type => {id: None}
+        type_fields = {}
+        type_ids = {}
+        for field_name, link_fields in expand.items():
+            for r in records:
+                value = r.get(field_name)
+                if type(value) is dict:
+                    value = [value]
+                elif type(value) is not list:
+                    continue
+                for link in value:
+                    if not is_link(link):
+                        continue
+                    fields = type_fields.setdefault(link['type'], [])
+                    for f in link_fields:
+                        if f not in fields:
+                            fields.append(f)
+                    type_ids.setdefault(link['type'], {})[link['id']] = None
+        
+        # (entity type, id) => the linked entity, with the fields read for its type
+        linked = {}
+        for linked_type, ids in type_ids.items():
+            ids = ids.keys()
+            ids.sort()
+            for entity in self.find(linked_type, [['id', 'in', ids]], type_fields[linked_type]):
+                linked[(linked_type, entity['id'])] = entity
+        
+        # links that were shared stay shared once expanded
+        copies = {}
+        def expanded(link, link_fields):
+            key = (id(link), tuple(link_fields))
+            if key in copies:
+                return copies[key]
+            entity = linked.get((link['type'], link['id']))
+            if entity is not None:
+                values = {}
+                for f in link_fields:
+                    values[f] = entity.get(f)
+                copies[key] = dict(link, **values)
+            else:
+                copies[key] = link
+            return copies[key]
+        
+        results = []
+        for r in records:
+            changes = {}
+            for field_name, link_fields in expand.items():
+                value = r.get(field_name)
+                if is_link(value):
+                    changes[field_name] = expanded(value, link_fields)
+                elif type(value) is list:
+                    links = []
+                    for link in value:
+                        if is_link(link):
+                            link = expanded(link, link_fields)
+                        links.append(link)
+                    changes[field_name] = links
+            if changes:
+                if isinstance(r, _CompactRecord):
+                    values = r.to_dict()
+                    values.update(changes)
+                    r = r.__class__([values[f] for f in r._fields])
+                else:
+                    r = dict(r)
+                    r.update(changes)
+            results.append(r)
+        return results
+    
+    def _page_request(self, req, page):
+        """
+        Return a copy of a read request that asks for the given page.
+        """
+        page_req = req.copy()
+        page_req["paging"] = {"entities_per_page": req["paging"]["entities_per_page"], "current_page": page}
+        self._skip_paging_info(page_req)
+        return page_req
+    
+    def _keyset_page_request(self, req, last_id, remaining):
+        """
+        Return a copy of a read request that asks for the next page of a keyset scan: the entities matching its
+        filters with an id greater than last_id.  remaining is how many more entities are wanted, or 0 for all.
+        Each page is a new query, so the page size can be re-tuned between pages.
+        """
+        per_page = self._page_size(req["type"], req["return_fields"])
+        if remaining > 0:
+            per_page = min(per_page, remaining)
+        
+        page_req = req.copy()
+        page_req["filters"] = {
+            "logical_operator": "and",
+            "conditions": [req["filters"], {"path": "id", "relation": "greater_than", "values": [last_id]}]
+        }
+        page_req["paging"] = {"entities_per_page": per_page, "current_page": 1}
+        return page_req
+    
+    def _read(self, api3, req):
+        """
+        Send a read request through the given connection.  When adaptive paging is on, the time the request took
+        and the size of the response are used to tune the page size for its entity type and fields.
+        """
+        if not self.adaptive_paging:
+            return api3.read(req)
+        
+        start = time.time()
+        resp = api3.read(req)
+        elapsed = time.time() - start
+        
+        self._tune_page_size(req, len(resp["results"]["entities"]), elapsed, api3.response_size())
+        return resp
+    
+    def _page_size_key(self, entity_type, fields):
+        fields = list(fields)
+        fields.sort()
+        return (entity_type, tuple(fields))
+    
+    def _page_size(self, entity_type, fields):
+        """
+        Return the number of entities to request per page for this entity type and set of fields.
+        """
+        if not self.adaptive_paging:
+            return self.records_per_page
+        return self._page_sizes.get(self._page_size_key(entity_type, fields), self.records_per_page)
+    
+    def _tune_page_size(self, req, num_entities, elapsed, num_bytes):
+        """
+        Move the page size for the request's entity type and fields towards one that would take
+        adaptive_page_secs and return at most adaptive_page_max_bytes.  The size changes by at most a factor of
+        two per page, so a single slow response can't throw it off.
+        """
+        per_page = req["paging"]["entities_per_page"]
+        # pages cut short by a limit say nothing about the tuned size
+        if num_entities == 0 or per_page != self._page_size(req["type"], req["return_fields"]):
+            return
+        
+        ideal = num_entities * self.adaptive_page_secs / max(elapsed, 0.001)
+        if num_bytes:
+            ideal = min(ideal, num_entities * float(self.adaptive_page_max_bytes) / num_bytes)
+        # a short page is only a reason to shrink, it doesn't show how long a full page would take
+        if num_entities < per_page and ideal > per_page:
+            return
+        
+        low, high = self.adaptive_page_range
+        new_size = int(min(max(ideal, per_page / 2, low), per_page * 2, high))
         
-        records = self._inject_field_values(records)
+        key = self._page_size_key(req["type"], req["return_fields"])
+        self._page_sizes_lock.acquire()
+        try:
+            self._page_sizes[key] = new_size
+        finally:
+            self._page_sizes_lock.release()
+    
+    def _read_pages(self, req, pages, finish=None):
+        """
+        Fetch the given pages of a read request in parallel over the connection pool and return their entities
+        concatenated in page order.  finish, if given, is applied to each page as it arrives.
+        """
+        def read_page(api3, page):
+            results = self._read(api3, self._page_request(req, page))["results"]["entities"]
+            if finish:
+                results = finish(results)
+            return results
         
+        records = []
+        for results in self._api3_pool.map(read_page, pages, self.connection_pool_size):
+            records.extend(results)
         return records
     
     def find_one(self, entity_type, filters, fields=None, order=None, filter_operator=None, retired_only=False):
@@ -453,10 +1309,119 @@ class Shotgun(object):
         else:
             return None
     
-    def _required_keys(self, message, required_keys, data):
-        missing = set(required_keys) - set(data.keys())
-        if missing:
-            raise ShotgunError("%s missing required key: %s. Value was: %s." % (message, ", ".join(missing), data))
+    def count(self, entity_type, filters, filter_operator=None, retired_only=False):
+        """
+        Return the number of entities of entity_type matching the given
+        filters, without transferring the entities themselves.
+        
+        Requires a server that returns paging info (v2.3.4 or higher).
+        """
+        req = self._count_request(entity_type, filters, filter_operator, retired_only)
+        resp = self._api3.read(req)
+        return resp["results"]["paging_info"]["entity_count"]
+    
+    def count_many(self, entity_type, filters_list, filter_operator=None, retired_only=False):
+        """
+        Same as count, but for each set of filters in filters_list.  The
+        queries run in parallel over the connection pool, and the counts
+        are returned as a list in the same order as filters_list.
+        """
+        reqs = []
+        for filters in filters_list:
+            reqs.append(self._count_request(entity_type, filters, filter_operator, retired_only))
+        
+        def count(api3, req):
+            return api3.read(req)["results"]["paging_info"]["entity_count"]
+        
+        return self._api3_pool.map(count, reqs, self.connection_pool_size)
+    
+    def _count_request(self, entity_type, filters, filter_operator, retired_only):
+        """
+        Build a read request for a single entity id along with the paging info that holds the total count.
+        """
+        if not self.supports_paging_info:
+            raise ShotgunError("Counting entities requires a Shotgun server that returns paging info (v2.3.4 or "
+                               "higher).")
+        req = self._find_request(entity_type, filters, ['id'], None, filter_operator, 1, retired_only, 1)
+        req["return_paging_info"] = True
+        return req
+    
+    def find_changed_since(self, entity_type, since, fields=None, filters=None, cursor_store=None, cursor_name=None):
+        """
+        Find the entities of entity_type that have changed since the given
+        datetime, to keep a local copy of them up to date without fetching
+        them all again.
+        
+        Returns a dict with:
+            'changed': active entities updated since 'since'
+            'retired': entities retired since 'since'
+            'high_water_mark': the latest updated_at seen (or 'since' if
+                nothing changed), to pass as 'since' next time
+        
+        If since is None, every entity is returned.  'filters' narrows the
+        entities to look at, in the same format find() accepts.
+        
+        With a CursorStore, the high-water mark is loaded from the store
+        under cursor_name (entity_type by default), falling back to
+        'since' the first time, and saved back once the entities have been
+        fetched.
+        
+        updated_at only has a resolution of one second, so entities
+        updated in the same second as the high-water mark are returned
+        again by the next call rather than risk missing a change made in
+        that second after this call read them.
+        """
+        if fields == None:
+            fields = ['id']
+        if filters == None:
+            filters = []
+        if cursor_name == None:
+            cursor_name = entity_type
+        if cursor_store is not None:
+            since = cursor_store.get(cursor_name, since)
+        
+        # match the datetimes the server returns, which are only timezone aware when converting to local time
+        if since is not None:
+            if self.convert_datetimes_to_utc and since.tzinfo is None:
+                since = since.replace(tzinfo=sg_timezone.local)
+            elif not self.convert_datetimes_to_utc and since.tzinfo is not None:
+                since = since.astimezone(sg_timezone.utc).replace(tzinfo=None)
+        
+        fields = list(fields)
+        if 'updated_at' not in fields:
+            fields.append('updated_at')
+        
+        if since is not None:
+            condition = ['updated_at', 'greater_than', since - timedelta(seconds=1)]
+            if type(filters) == type([]):
+                filters = filters + [condition]
+            else:
+                filters = {
+                    "logical_operator": "and",
+                    "conditions": [filters, {"path": condition[0], "relation": condition[1], "values": condition[2:]}]
+                }
+        
+        changed = self.find(entity_type, filters, fields, keyset_paging=True)
+        retired = self.find(entity_type, filters, fields, retired_only=True, keyset_paging=True)
+        
+        high_water_mark = since
+        for record in changed + retired:
+            if record['updated_at'] and (high_water_mark is None or record['updated_at'] > high_water_mark):
+                high_water_mark = record['updated_at']
+        
+        if cursor_store is not None and high_water_mark is not None:
+            cursor_store.set(cursor_name, high_water_mark)
+        
+        return {'changed': changed, 'retired': retired, 'high_water_mark': high_water_mark}
+    
+    def _invalidate_cache(self, entity_type):
+        if self.result_cache is not None:
+            self.result_cache.invalidate(entity_type)
+    
+    def _required_keys(self, message, required_keys, data):
+        missing = set(required_keys) - set(data.keys())
+        if missing:
+            raise ShotgunError("%s missing required key: %s. Value was: %s." % (message, ", ".join(missing), data))
     
     def batch(self, requests):
         if type(requests) != type([]):
@@ -466,6 +1431,7 @@ class Shotgun(object):
         
         for r in requests:
             self._required_keys("Batched request",['request_type','entity_type'],r)
+            self._need_field_types(r["entity_type"], r.get("return_fields", []))
             
             if r["request_type"] == "create":
                 self._required_keys("Batched create request",['data'],r)
@@ -477,7 +1443,7 @@ class Shotgun(object):
                 }
                 
                 if "return_fields" in r:
-                    nr["return_fields"] = r
+                    nr["return_fields"] = r["return_fields"]
                 
                 for f,v in r["data"].items():
                     nr["fields"].append( { "field_name": f, "value": v } )
@@ -511,7 +1477,12 @@ class Shotgun(object):
                 raise ShotgunError("Invalid request_type for batch")
         
         resp = self._api3.batch(reqs)
-        records = self._inject_field_values(resp["results"])
+        returned = []
+        for r in requests:
+            self._invalidate_cache(r["entity_type"])
+            returned.extend(r.get("data", {}).keys())
+            returned.extend(r.get("return_fields", []))
+        records = self._inject_field_values(resp["results"], None, returned)
         
         return records
     
@@ -533,8 +1504,10 @@ class Shotgun(object):
         for f,v in data.items():
             args["fields"].append( {"field_name":f,"value":v} )
         
+        self._need_field_types(entity_type, return_fields)
         resp = self._api3.create(args)
-        record = self._inject_field_values([resp["results"]])[0]
+        self._invalidate_cache(entity_type)
+        record = self._inject_field_values([resp["results"]], entity_type, list(return_fields) + data.keys())[0]
         return record
     
     def update(self, entity_type, entity_id, data):
@@ -548,8 +1521,10 @@ class Shotgun(object):
         for f,v in data.items():
             args["fields"].append( {"field_name":f,"value":v} )
         
+        self._need_field_types(entity_type)
         resp = self._api3.update(args)
-        records = self._inject_field_values([resp["results"]])
+        self._invalidate_cache(entity_type)
+        records = self._inject_field_values([resp["results"]], entity_type, data.keys())
         return records
     
     def delete(self, entity_type, entity_id):
@@ -557,6 +1532,7 @@ class Shotgun(object):
         Retire an entity given the entity_type, and entity_id
         """
         resp = self._api3.delete( {"type":entity_type, "id":entity_id} )
+        self._invalidate_cache(entity_type)
         return resp["results"]
     
     def revive(self, entity_type, entity_id):
@@ -564,6 +1540,7 @@ class Shotgun(object):
         Revive an entity given the entity_type, and entity_id
         """
         resp = self._api3.revive( {"type":entity_type, "id":entity_id} )
+        self._invalidate_cache(entity_type)
         return resp["results"]
     
     def upload(self, entity_type, entity_id, path, field_name=None, display_name=None, tag_list=None):
@@ -620,6 +1597,8 @@ class Shotgun(object):
             if not str(result).startswith("1"):
                 raise ShotgunError("Could not upload file successfully, but not sure why.\nPath: %s\nUrl: %s\nError: %s" % (path, url, str(result)))
         
+        self._invalidate_cache(entity_type)
+        
         # we changed the result string in the middle of 1.8 to return the id
         # remove once everyone is > 1.8.3
         r = str(result).split(":")
@@ -670,72 +1649,1395 @@ class Shotgun(object):
     
     def _get_session_token(self):
         """
-        Hack to authenticate in order to download protected content
-        like Attachments
+        Hack to authenticate in order to download protected content
+        like Attachments
+        """
+        if self.sid == None:
+            # HACK: use API2 to get token for now until we better resolve how we manage Attachments in general
+            api2_url = "%s/%s/" % (self.base_url, 'api2')
+            conn = ServerProxy(api2_url)
+            self.sid = conn.getSessionToken([self.script_name, self.api_key])['session_id']
+        return self.sid
+    
+    # Deprecated methods from old wrapper
+    def schema(self, entity_type):
+        raise ShotgunError("Deprecated: use schema_field_read('type':'%s') instead" % entity_type)
+    
+    def entity_types(self):
+        raise ShotgunError("Deprecated: use schema_entity_read() instead")
+
+class ShotgunCRUD(object):
+    def __init__(self, options):
+        self.__sg_url = options['server_url']
+        self.__auth_args = {'script_name': options['script_name'], 'script_key': options['script_key']}
+        
+        if 'session_uuid' in options:
+            self.__auth_args['session_uuid'] = options['session_uuid']
+        
+        if 'convert_datetimes_to_utc' in options:
+            convert_datetimes_to_utc = options['convert_datetimes_to_utc']
+        else:
+            convert_datetimes_to_utc = 1
+        if 'error_stream' in options:
+            self.__err_stream = options['error_stream']
+        else:
+            self.__err_stream = 'sys.stderr'
+        stream_request_bytes = options.get('stream_request_bytes')
+        # None for XML-RPC, which ServerProxy sets up itself
+        codec = None
+        if options.get('wire_format') == 'json':
+            codec = JsonCodec(convert_datetimes_to_utc=convert_datetimes_to_utc, field_types=options.get('field_types'))
+            self.__sg_url += codec.path
+        # the requests are built by Shotgun's methods, so skip the marshaller's checks for recursive values
+        if 'http_proxy' in options and options['http_proxy']:
+            p = ProxiedTransport()
+            p.set_proxy( options['http_proxy'] )
+            self.__sg = ServerProxy(self.__sg_url, convert_datetimes_to_utc = convert_datetimes_to_utc, transport=p,
+                                    check_recursion=0, stream_request_bytes=stream_request_bytes, codec=codec)
+        else:
+            self.__sg = ServerProxy(self.__sg_url, convert_datetimes_to_utc = convert_datetimes_to_utc,
+                                    check_recursion=0, stream_request_bytes=stream_request_bytes, codec=codec)
+        self.__single_flight = options.get('single_flight')
+        transport = self.__sg("transport")
+        transport.share_values = options.get('share_values', True)
+        transport.decode_memo = options.get('decode_memo')
+        transport.chunked_requests = options.get('chunked_requests', False)
+        transport.pause_gc = options.get('pause_gc', False)
+        transport.accept_compressed = options.get('compress_responses', False)
+        transport.compress_request_bytes = options.get('compress_request_bytes')
+        # calls are only coalesced with others whose responses would be decoded the same way
+        decode_memo = transport.decode_memo
+        if decode_memo is not None:
+            decode_memo = id(decode_memo)
+        self.__decode_options = (bool(convert_datetimes_to_utc), bool(transport.share_values), decode_memo)
+    
+    # methods that only read, so identical calls in flight at the same time can share one request
+    coalesced_methods = ('read', 'schema_read', 'schema_field_read', 'schema_entity_read')
+    
+    def __getattr__(self, attr):
+        def callable(*args, **kwargs):
+            return self.meta_caller(attr, *args, **kwargs)
+        return callable
+    
+    def info(self):
+        try:
+            server_info = self.__sg.info()
+        except:
+            server_info = {}
+        
+        return server_info
+    
+    def response_size(self):
+        """
+        Size in bytes of the body of the last response received on this connection, after decompression.
+        """
+        return self.__sg("transport").response_size
+    
+    def meta_caller(self, attr, *args, **kwargs):
+        if self.__single_flight is not None and attr in self.coalesced_methods:
+            key = (self.__sg_url, attr, self.__decode_options, _canonical(self.__auth_args), _canonical(args),
+                   _canonical(kwargs))
+            result, size = self.__single_flight.do(key, self._call_server_sized, attr, args, kwargs)
+            # whoever waited for someone else's call received that call's response
+            self.__sg("transport").response_size = size
+            return result
+        return self._call_server(attr, args, kwargs)
+    
+    def _call_server_sized(self, attr, args, kwargs):
+        result = self._call_server(attr, args, kwargs)
+        return result, self.__sg("transport").response_size
+    
+    def _call_server(self, attr, args, kwargs):
+        try:
+            return eval(
+                'self._%s__sg.%s(self._%s__auth_args, *args, **kwargs)' %
+                (self.__class__.__name__, attr, self.__class__.__name__)
+            )
+        except Fault, e:
+            self._report_fault(e)
+            raise
+    
+    def stream_read(self, req):
+        """
+        Send a read request, and return a generator yielding the entities of the response in lists, each as soon
+        as its part of the response has arrived and been decoded.  The connection is busy until the generator
+        has been run to the end.
+        """
+        try:
+            for entities in self.__sg("stream")("read", (self.__auth_args, req)):
+                yield entities
+        except Fault, e:
+            self._report_fault(e)
+            raise
+    
+    def close(self):
+        """
+        Close the connection to the server.  The next request opens a new one.
+        """
+        self.__sg("close")()
+    
+    def _report_fault(self, e):
+        if self.__err_stream:
+            eval('%s.write("\\n" + "-"*80 + "\\n")' % self.__err_stream)
+            eval('%s.write("XMLRPC Fault %s:\\n")' % (self.__err_stream, e.faultCode))
+            eval('%s.write(e.faultString)' % self.__err_stream)
+            eval('%s.write("\\n" + "-"*80 + "\\n")' % self.__err_stream)
+
+def _canonical(value):
+    # hashable equivalent of a request value: dicts compare by their items, lists and tuples by their contents
+    if isinstance(value, dict):
+        items = [(k, _canonical(v)) for k, v in value.items()]
+        items.sort()
+        return ('dict', tuple(items))
+    if isinstance(value, (list, tuple)):
+        return tuple([_canonical(v) for v in value])
+    return value
+
+class _CompactRecord(object):
+    """
+    Read-only mapping methods shared by the compact records find() returns with a record_format.  Subclasses are
+    made per set of fields by _record_class(), and provide _fields, the field names in order, _index, mapping
+    each field name to its position, _value(i), returning the value at a position, and _values(), returning all
+    the values in the same order.
+    """
+    __slots__ = ()
+    
+    def __getitem__(self, key):
+        try:
+            i = self._index[key]
+        except (KeyError, TypeError):
+            raise KeyError(key)
+        return self._value(i)
+    
+    def get(self, key, default=None):
+        try:
+            i = self._index[key]
+        except (KeyError, TypeError):
+            return default
+        return self._value(i)
+    
+    def has_key(self, key):
+        return key in self._index
+    
+    def keys(self):
+        return list(self._fields)
+    
+    def values(self):
+        return list(self._values())
+    
+    def items(self):
+        return zip(self._fields, self._values())
+    
+    def to_dict(self):
+        return dict(zip(self._fields, self._values()))
+    
+    def __reduce__(self):
+        # the classes are made on the fly, so rebuild them on unpickling
+        return (_make_record, (self._format, self._fields, tuple(self._values())))
+
+class _SlotRecord(_CompactRecord):
+    """
+    Record that keeps its values in __slots__ and otherwise behaves like a read-only dict.
+    """
+    __slots__ = ()
+    
+    def __init__(self, values):
+        for name, value in zip(self._slots, values):
+            object.__setattr__(self, name, value)
+    
+    def __getitem__(self, key):
+        try:
+            i = self._index[key]
+        except (KeyError, TypeError):
+            raise KeyError(key)
+        return getattr(self, self._slots[i])
+    
+    def _value(self, i):
+        return getattr(self, self._slots[i])
+    
+    def _values(self):
+        values = []
+        for name in self._slots:
+            values.append(getattr(self, name))
+        return values
+    
+    def __contains__(self, key):
+        return key in self._index
+    
+    def __iter__(self):
+        return iter(self._fields)
+    
+    def __len__(self):
+        return len(self._fields)
+    
+    def __eq__(self, other):
+        if isinstance(other, _CompactRecord):
+            other = other.to_dict()
+        return self.to_dict() == other
+    
+    def __ne__(self, other):
+        return not self == other
+    
+    def __repr__(self):
+        return repr(self.to_dict())
+
+class _TupleRecord(_CompactRecord, tuple):
+    """
+    Tuple of the values, in the order of the field names in _fields.  Field names can be used as indexes too, but
+    everything else (iterating, len, in, comparisons) is a tuple's.
+    """
+    __slots__ = ()
+    
+    def __getitem__(self, key):
+        try:
+            i = self._index[key]
+        except (KeyError, TypeError):
+            # positions and slices
+            if isinstance(key, basestring):
+                raise KeyError(key)
+            return tuple.__getitem__(self, key)
+        return tuple.__getitem__(self, i)
+    
+    def _value(self, i):
+        return tuple.__getitem__(self, i)
+    
+    def _values(self):
+        return self
+
+class _ListColumn(object):
+    """
+    find_columns() column of values of any type, kept as a list.  finish() returns a dict of the column names
+    and the finished columns.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.values = []
+    
+    def extend(self, values):
+        self.values.extend(values)
+    
+    def finish(self):
+        return {self.name: self.values}
+
+class _IntColumn(_ListColumn):
+    def __init__(self, name):
+        self.name = name
+        self.values = array.array('l')
+        self.missing = []
+    
+    def extend(self, values):
+        for v in values:
+            if v is None:
+                self.missing.append(len(self.values))
+                v = 0
+            self.values.append(int(v))
+    
+    def finish(self):
+        if numpy is not None:
+            values = numpy.frombuffer(self.values, dtype=numpy.dtype('l')).astype(numpy.int64)
+            if self.missing:
+                values = values.astype(numpy.float64)
+                values[self.missing] = numpy.nan
+            return {self.name: values}
+        
+        values = self.values
+        if self.missing:
+            values = values.tolist()
+            for i in self.missing:
+                values[i] = None
+        return {self.name: values}
+
+class _FloatColumn(_ListColumn):
+    def __init__(self, name):
+        self.name = name
+        self.values = array.array('d')
+    
+    def extend(self, values):
+        for v in values:
+            if v is None:
+                self.values.append(_nan)
+            else:
+                self.values.append(float(v))
+    
+    def finish(self):
+        if numpy is not None:
+            return {self.name: numpy.frombuffer(self.values, dtype=numpy.float64).copy()}
+        return {self.name: self.values}
+
+class _DateTimeColumn(_ListColumn):
+    def __init__(self, name):
+        self.name = name
+        if numpy is None:
+            self.values = []
+        else:
+            # seconds since the epoch in UTC, NaN for missing values
+            self.values = array.array('d')
+    
+    def extend(self, values):
+        if numpy is None:
+            self.values.extend(values)
+            return
+        for v in values:
+            if v is None:
+                self.values.append(_nan)
+            else:
+                self.values.append(calendar.timegm(v.utctimetuple()))
+    
+    def finish(self):
+        if numpy is None:
+            return {self.name: self.values}
+        seconds = numpy.frombuffer(self.values, dtype=numpy.float64)
+        missing = numpy.isnan(seconds)
+        values = numpy.where(missing, 0, seconds).astype(numpy.int64).view('datetime64[s]')
+        values[missing] = numpy.datetime64('NaT')
+        return {self.name: values}
+
+class _DateColumn(_ListColumn):
+    def finish(self):
+        if numpy is None:
+            return {self.name: self.values}
+        values = []
+        for v in self.values:
+            if v is None:
+                v = 'NaT'
+            values.append(v)
+        return {self.name: numpy.array(values, dtype='datetime64[D]')}
+
+class _LinkColumn(_ListColumn):
+    # entity links are split into a list of types and a numeric column of ids
+    def __init__(self, name):
+        self.name = name
+        self.types = []
+        self.ids = _IntColumn("%s.id" % (name))
+    
+    def extend(self, values):
+        ids = []
+        for v in values:
+            if v is None:
+                self.types.append(None)
+                ids.append(None)
+            else:
+                self.types.append(v['type'])
+                ids.append(v['id'])
+        self.ids.extend(ids)
+    
+    def finish(self):
+        columns = self.ids.finish()
+        columns["%s.type" % (self.name)] = self.types
+        return columns
+
+# float('nan') isn't portable before python 2.6
+_nan = (1e300 * 1e300) - (1e300 * 1e300)
+
+_column_classes = {
+    'number': _IntColumn, 'percent': _IntColumn, 'duration': _IntColumn, 'timecode': _IntColumn,
+    'float': _FloatColumn, 'currency': _FloatColumn,
+    'date_time': _DateTimeColumn, 'date': _DateColumn,
+}
+
+def _column_class(data_type):
+    return _column_classes.get(data_type, _ListColumn)
+
+# (record_format, fields) => record class
+_record_classes = {}
+_identifier = re.compile(r"^[A-Za-z][A-Za-z0-9_]*$")
+
+def _record_class(record_format, fields):
+    """
+    Return the record class for find() results in record_format with the given return fields.  Records always
+    start with 'type' and 'id', like the dicts the server returns.
+    """
+    record_fields = ['type', 'id']
+    for f in fields:
+        if f not in record_fields:
+            record_fields.append(f)
+    record_fields = tuple(record_fields)
+    
+    key = (record_format, record_fields)
+    record_class = _record_classes.get(key)
+    if record_class is not None:
+        return record_class
+    
+    index = {}
+    for i, f in enumerate(record_fields):
+        index[f] = i
+    attrs = {'_format': record_format, '_fields': record_fields, '_index': index, '__slots__': ()}
+    if record_format == 'slots':
+        # fields that aren't usable as attribute names are stored in positional slots
+        slots = []
+        for i, f in enumerate(record_fields):
+            if _identifier.match(f) and not keyword.iskeyword(f) and not hasattr(_SlotRecord, f):
+                slots.append(f)
+            else:
+                slots.append('_%d' % (i))
+        attrs['__slots__'] = attrs['_slots'] = tuple(slots)
+        record_class = type('SlotRecord', (_SlotRecord,), attrs)
+    elif record_format == 'tuple':
+        record_class = type('TupleRecord', (_TupleRecord,), attrs)
+    else:
+        raise ShotgunError("Invalid record_format '%s'.  Use 'dict', 'slots' or 'tuple'." % (record_format))
+    
+    _record_classes[key] = record_class
+    return record_class
+
+def _make_record(record_format, fields, values):
+    return _record_class(record_format, fields[2:])(values)
+
+class ResultCache(object):
+    """
+    Thread-safe, size-bounded LRU cache for the results of Shotgun.find() and find_one().  Enable it by assigning
+    one to Shotgun.result_cache:
+    
+        sg.result_cache = ResultCache(max_entries=5000, ttl=60, entity_ttls={'Project': 3600})
+    
+    Results expire after entity_ttls[entity_type] seconds, or ttl seconds for entity types that aren't listed.  A
+    ttl of 0 disables caching for that entity type and None keeps results until they're evicted.  All the cached
+    results for an entity type are dropped whenever create(), update(), delete(), revive(), batch() or upload()
+    touch that entity type through the same Shotgun object.  Results of queries that filter on fields of linked
+    entities aren't dropped when the linked entity type changes.
+    
+    Callers get their own copies of cached results, so they're free to modify them.  hits and misses count
+    lookups for tuning the cache size.
+    """
+    # positions in the entry lists that make up the doubly linked LRU list
+    PREV, NEXT, KEY, ENTITY_TYPE, EXPIRES, VALUE = range(6)
+    
+    def __init__(self, max_entries=1000, ttl=60, entity_ttls=None):
+        if entity_ttls == None:
+            entity_ttls = {}
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entity_ttls = entity_ttls
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.clear()
+    
+    def key(self, *args):
+        """
+        Build a hashable cache key from query arguments.  Dicts are compared by their items, and lists and tuples
+        by their contents, so equal queries map to the same key.
+        """
+        return _canonical(args)
+    
+    def clear(self):
+        self._lock.acquire()
+        try:
+            self._entries = {}
+            self._root = root = [None] * 6
+            root[self.PREV] = root[self.NEXT] = root
+        finally:
+            self._lock.release()
+    
+    def get(self, key):
+        """
+        Return a (found, value) tuple for the given key.
+        """
+        self._lock.acquire()
+        try:
+            entry = self._entries.get(key)
+            if entry is not None and entry[self.EXPIRES] is not None and entry[self.EXPIRES] < time.time():
+                self._remove(entry)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return False, None
+            
+            # move to the most recently used end of the list
+            self._unlink(entry)
+            self._link(entry)
+            self.hits += 1
+            value = entry[self.VALUE]
+        finally:
+            self._lock.release()
+        return True, copy.deepcopy(value)
+    
+    def set(self, key, entity_type, value):
+        ttl = self.entity_ttls.get(entity_type, self.ttl)
+        if ttl == 0 or self.max_entries <= 0:
+            return
+        expires = None
+        if ttl is not None:
+            expires = time.time() + ttl
+        value = copy.deepcopy(value)
+        
+        self._lock.acquire()
+        try:
+            if key in self._entries:
+                self._remove(self._entries[key])
+            entry = [None, None, key, entity_type, expires, value]
+            self._entries[key] = entry
+            self._link(entry)
+            while len(self._entries) > self.max_entries:
+                self._remove(self._root[self.NEXT])
+        finally:
+            self._lock.release()
+    
+    def invalidate(self, entity_type):
+        """
+        Drop all the cached results for entity_type.
+        """
+        self._lock.acquire()
+        try:
+            for entry in self._entries.values():
+                if entry[self.ENTITY_TYPE] == entity_type:
+                    self._remove(entry)
+        finally:
+            self._lock.release()
+    
+    def __len__(self):
+        return len(self._entries)
+    
+    def _link(self, entry):
+        root = self._root
+        last = root[self.PREV]
+        entry[self.PREV] = last
+        entry[self.NEXT] = root
+        last[self.NEXT] = root[self.PREV] = entry
+    
+    def _unlink(self, entry):
+        entry[self.PREV][self.NEXT] = entry[self.NEXT]
+        entry[self.NEXT][self.PREV] = entry[self.PREV]
+    
+    def _remove(self, entry):
+        self._unlink(entry)
+        del self._entries[entry[self.KEY]]
+
+def _format_cursor(value):
+    # timezone aware datetimes are written in UTC and marked with a Z
+    if value.tzinfo is not None:
+        return value.astimezone(sg_timezone.utc).strftime("%Y%m%dT%H:%M:%SZ")
+    return value.strftime("%Y%m%dT%H:%M:%S")
+
+def _parse_cursor(value):
+    if value.endswith("Z"):
+        return _datetime_type(value[:-1]).replace(tzinfo=sg_timezone.utc)
+    return _datetime_type(value)
+
+class CursorStore(object):
+    """
+    Small on-disk store of named high-water marks for Shotgun.find_changed_since(), so an incremental sync can
+    pick up where the previous run left off.  The marks are kept as text in a single file, one "name<tab>datetime"
+    per line, and the file is replaced atomically on every change so a crash never leaves it half written.
+    Timezone aware datetimes are stored in UTC and come back in UTC.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+    
+    def get(self, name, default=None):
+        return self._load().get(name, default)
+    
+    def set(self, name, value):
+        self._lock.acquire()
+        try:
+            cursors = self._load()
+            cursors[name] = value
+            self._save(cursors)
+        finally:
+            self._lock.release()
+    
+    def delete(self, name):
+        self._lock.acquire()
+        try:
+            cursors = self._load()
+            if name in cursors:
+                del cursors[name]
+                self._save(cursors)
+        finally:
+            self._lock.release()
+    
+    def _load(self):
+        cursors = {}
+        if not os.path.exists(self.path):
+            return cursors
+        f = open(self.path, "r")
+        try:
+            for line in f:
+                line = line.rstrip("\n")
+                if not line:
+                    continue
+                name, value = line.rsplit("\t", 1)
+                cursors[name] = _parse_cursor(value)
+        finally:
+            f.close()
+        return cursors
+    
+    def _save(self, cursors):
+        lines = []
+        for name, value in cursors.items():
+            lines.append("%s\t%s\n" % (name, _format_cursor(value)))
+        
+        tmp_path = "%s.%d.tmp" % (self.path, os.getpid())
+        f = open(tmp_path, "w")
+        try:
+            f.writelines(lines)
+        finally:
+            f.close()
+        _replace_file(tmp_path, self.path)
+
+def _replace_file(tmp_path, path):
+    # windows can't rename over an existing file
+    if sys.platform == "win32" and os.path.exists(path):
+        os.remove(path)
+    os.rename(tmp_path, path)
+
+class SchemaCache(object):
+    """
+    Field schemas of the entity types of one Shotgun server, loaded one entity type at a time as they're asked for
+    and kept for expire_mins minutes.  With a path, the schemas are also kept in that file so every process on the
+    machine can use them: the file is reread whenever another process has changed it, and replaced atomically on
+    every change.  The file is written in XML-RPC so reading it never runs code from it.  The file's directory is
+    only used if it belongs to the current user and nobody else can write to it, otherwise the schemas are only
+    kept in memory.
+    
+    Callers get their own copies of the cached schemas.
+    """
+    def __init__(self, path=None, expire_mins=60):
+        self.path = path
+        self.expire_mins = expire_mins
+        self._lock = threading.Lock()
+        # entity_type => [read_at, fields]
+        self._entity_types = {}
+        # when the whole schema was last read with schema_read(), None if it hasn't been
+        self._complete_at = None
+        self._mtime = None
+    
+    def get(self, entity_type):
+        """
+        Return the fields of entity_type, or None if they aren't cached or have expired.
+        """
+        self._lock.acquire()
+        try:
+            self._refresh()
+            entry = self._entity_types.get(entity_type)
+            if entry is None or self._expired(entry[0]):
+                return None
+            fields = entry[1]
+        finally:
+            self._lock.release()
+        return copy.deepcopy(fields)
+    
+    def get_all(self):
+        """
+        Return the whole schema, if it has been cached by set_all() and none of it has expired or been dropped
+        since.
+        """
+        self._lock.acquire()
+        try:
+            self._refresh()
+            if self._complete_at is None or self._expired(self._complete_at):
+                return None
+            schema = {}
+            for entity_type, entry in self._entity_types.items():
+                if self._expired(entry[0]):
+                    return None
+                schema[entity_type] = entry[1]
+        finally:
+            self._lock.release()
+        return copy.deepcopy(schema)
+    
+    def set(self, entity_type, fields):
+        self._update({entity_type: fields}, False)
+    
+    def set_all(self, schema):
+        self._update(schema, True)
+    
+    def invalidate(self, entity_type=None):
+        """
+        Drop the fields of entity_type, or of every entity type.
+        """
+        self._lock.acquire()
+        try:
+            self._refresh()
+            if entity_type is None:
+                self._entity_types = {}
+            else:
+                self._entity_types.pop(entity_type, None)
+            self._complete_at = None
+            self._save()
+        finally:
+            self._lock.release()
+    
+    def _expired(self, read_at):
+        return read_at + self.expire_mins * 60 < time.time()
+    
+    def _update(self, schema, complete):
+        now = time.time()
+        schema = copy.deepcopy(schema)
+        self._lock.acquire()
+        try:
+            self._refresh()
+            if complete:
+                self._entity_types = {}
+                self._complete_at = now
+            for entity_type, fields in schema.items():
+                self._entity_types[entity_type] = [now, fields]
+            self._save()
+        finally:
+            self._lock.release()
+    
+    def _refresh(self):
+        # pick up changes made to the file by other processes
+        if self.path is None:
+            return
+        try:
+            mtime = None
+            if self._dir_is_safe(os.path.dirname(self.path)):
+                mtime = os.stat(self.path).st_mtime
+        except OSError:
+            mtime = None
+        if mtime == self._mtime:
+            return
+        
+        self._entity_types = {}
+        self._complete_at = None
+        self._mtime = mtime
+        if mtime is None:
+            return
+        try:
+            f = open(self.path, "r")
+            try:
+                data = loads(f.read(), use_datetime=1, convert_datetimes_to_utc=0)[0][0]
+            finally:
+                f.close()
+            for entity_type, entry in data["entity_types"].items():
+                self._entity_types[entity_type] = [entry["read_at"], entry["fields"]]
+            self._complete_at = data["complete_at"]
+        except Exception:
+            # unreadable, it'll be rewritten with the next change
+            self._entity_types = {}
+            self._complete_at = None
+    
+    def _save(self):
+        if self.path is None:
+            return
+        entity_types = {}
+        for entity_type, entry in self._entity_types.items():
+            entity_types[entity_type] = {"read_at": entry[0], "fields": entry[1]}
+        data = dumps(({"entity_types": entity_types, "complete_at": self._complete_at},), methodresponse=1,
+                     allow_none=1, convert_datetimes_to_utc=0)
+        
+        cache_dir = os.path.dirname(self.path)
+        tmp_path = None
+        try:
+            if not os.path.lexists(cache_dir):
+                os.makedirs(cache_dir, 0700)
+            if not self._dir_is_safe(cache_dir):
+                return
+            fd, tmp_path = tempfile.mkstemp(".tmp", os.path.basename(self.path) + ".", cache_dir)
+            f = os.fdopen(fd, "w")
+            try:
+                f.write(data)
+            finally:
+                f.close()
+            _replace_file(tmp_path, self.path)
+            tmp_path = None
+            self._mtime = os.stat(self.path).st_mtime
+        except (IOError, OSError):
+            # the schemas are still cached in memory
+            if tmp_path is not None:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+    
+    def _dir_is_safe(self, cache_dir):
+        # the directory has to be a real one of our own, that nobody else can put files (or links) in
+        if not hasattr(os, "getuid"):
+            return os.path.isdir(cache_dir)
+        try:
+            st = os.lstat(cache_dir)
+        except OSError:
+            return False
+        return (stat.S_ISDIR(st.st_mode) and st.st_uid == os.getuid() and
+                not st.st_mode & (stat.S_IWGRP | stat.S_IWOTH))
+
+class _ReplicaMiss(Exception):
+    # raised when a query can't be answered from a ShotgunReplica
+    pass
+
+class ShotgunReplica(object):
+    """
+    Local SQLite copy of selected entity types and fields that answers the
+    same queries as Shotgun.find() without going to the server.
+    
+        replica = ShotgunReplica(sg, "/var/tmp/shotgun.db", max_age=300)
+        replica.replicate("Shot", ["code", "sg_status_list", "project"])
+        replica.sync()
+        shots = replica.find("Shot", [["sg_status_list", "is", "ip"]], ["code"])
+    
+    sync() fetches only what changed since the last sync, using
+    Shotgun.find_changed_since().  The database can be shared by several
+    processes, with one of them syncing it.  Entities are also kept in
+    memory once they've been read, and are only reloaded from the database
+    after a sync.
+    
+    find() and find_one() fall back to the Shotgun server when the query
+    can't be answered from the replica: the entity type or a requested,
+    filtered or sorted field isn't replicated, a filter uses a linked field
+    path or a relation other than is, is_not, less_than, greater_than,
+    contains, not_contains, starts_with, ends_with, between, in or not_in,
+    or the entity type hasn't been synced within the last max_age seconds.
+    Text comparisons are case insensitive, as they are on the server.
+    
+    Entities deleted outright on the server (rather than retired) aren't
+    removed from the replica.
+    """
+    relations = ("is", "is_not", "less_than", "greater_than", "contains", "not_contains", "starts_with",
+                 "ends_with", "between", "in", "not_in")
+    
+    def __init__(self, sg, path, max_age=None):
+        if sqlite3 is None:
+            raise ShotgunError("ShotgunReplica requires the sqlite3 module.")
+        self.sg = sg
+        self.path = path
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        # entity_type => (synced_at, {retired: [records]}) of entities already loaded from the database
+        self._loaded = {}
+        
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS replica_types (entity_type TEXT PRIMARY KEY, fields TEXT, "
+                         "high_water_mark TEXT, synced_at REAL)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS replica_entities (entity_type TEXT, id INTEGER, "
+                         "retired INTEGER, data BLOB, PRIMARY KEY (entity_type, id))")
+        self._db.commit()
+    
+    def close(self):
+        self._db.close()
+    
+    def replicate(self, entity_type, fields):
+        """
+        Add entity_type to the replica, keeping the given fields.  Changing
+        the fields of an entity type that's already replicated drops its
+        entities, so the next sync fetches them all again.
+        """
+        fields = list(fields)
+        for f in ('id', 'updated_at'):
+            if f not in fields:
+                fields.append(f)
+        fields.sort()
+        
+        self._lock.acquire()
+        try:
+            row = self._db.execute("SELECT fields FROM replica_types WHERE entity_type = ?",
+                                   (entity_type,)).fetchone()
+            if row and row[0] == ",".join(fields):
+                return
+            self._db.execute("DELETE FROM replica_entities WHERE entity_type = ?", (entity_type,))
+            self._db.execute("INSERT OR REPLACE INTO replica_types VALUES (?, ?, NULL, NULL)",
+                             (entity_type, ",".join(fields)))
+            self._db.commit()
+            self._loaded.pop(entity_type, None)
+        finally:
+            self._lock.release()
+    
+    def entity_types(self):
+        """
+        Return a dict of the replicated entity types and their fields.
+        """
+        types = {}
+        for entity_type, fields in self._db.execute("SELECT entity_type, fields FROM replica_types").fetchall():
+            types[entity_type] = fields.split(",")
+        return types
+    
+    def sync(self, entity_types=None):
+        """
+        Fetch the entities that changed on the server since the last sync,
+        for all the replicated entity types or just the ones given.
+        """
+        replicated = self.entity_types()
+        if entity_types == None:
+            entity_types = replicated.keys()
+        
+        for entity_type in entity_types:
+            if entity_type not in replicated:
+                raise ShotgunError("%s isn't replicated.  Add it with replicate() first." % entity_type)
+            
+            row = self._db.execute("SELECT high_water_mark FROM replica_types WHERE entity_type = ?",
+                                   (entity_type,)).fetchone()
+            since = None
+            if row[0]:
+                since = _parse_cursor(row[0])
+            
+            synced_at = time.time()
+            changes = self.sg.find_changed_since(entity_type, since, replicated[entity_type])
+            rows = []
+            for retired, records in ((0, changes['changed']), (1, changes['retired'])):
+                for r in records:
+                    data = cPickle.dumps(self._encode(r), 2)
+                    rows.append((entity_type, r['id'], retired, sqlite3.Binary(data)))
+            
+            high_water_mark = None
+            if changes['high_water_mark'] is not None:
+                high_water_mark = _format_cursor(changes['high_water_mark'])
+            
+            self._lock.acquire()
+            try:
+                self._db.executemany("INSERT OR REPLACE INTO replica_entities VALUES (?, ?, ?, ?)", rows)
+                self._db.execute("UPDATE replica_types SET high_water_mark = ?, synced_at = ? WHERE entity_type = ?",
+                                 (high_water_mark, synced_at, entity_type))
+                self._db.commit()
+            finally:
+                self._lock.release()
+    
+    def find(self, entity_type, filters, fields=None, order=None, filter_operator=None, limit=0, retired_only=False,
+             page=0):
+        """
+        Same as Shotgun.find(), answered from the replica when possible.
+        """
+        try:
+            return self._find(entity_type, filters, fields, order, filter_operator, limit, retired_only, page)
+        except _ReplicaMiss:
+            return self.sg.find(entity_type, filters, fields, order, filter_operator, limit, retired_only, page)
+    
+    def find_one(self, entity_type, filters, fields=None, order=None, filter_operator=None, retired_only=False):
+        """
+        Same as Shotgun.find_one(), answered from the replica when possible.
+        """
+        result = self.find(entity_type, filters, fields, order, filter_operator, 1, retired_only)
+        if len(result) > 0:
+            return result[0]
+        else:
+            return None
+    
+    def _find(self, entity_type, filters, fields, order, filter_operator, limit, retired_only, page):
+        if fields == None:
+            fields = ['id']
+        if order == None:
+            order = []
+        
+        row = self._db.execute("SELECT fields, synced_at FROM replica_types WHERE entity_type = ?",
+                               (entity_type,)).fetchone()
+        if not row or row[1] is None:
+            raise _ReplicaMiss()
+        if self.max_age is not None and time.time() - row[1] > self.max_age:
+            raise _ReplicaMiss()
+        
+        available = row[0].split(",") + ['type']
+        filters = self.sg._translate_filters(filters, filter_operator)
+        self._check_filters(filters, available)
+        sorts = []
+        for sort in order:
+            field_name = sort.get('field_name', sort.get('column'))
+            if field_name not in available:
+                raise _ReplicaMiss()
+            sorts.append((field_name, sort.get('direction', 'asc') == 'desc'))
+        for f in fields:
+            if f not in available:
+                raise _ReplicaMiss()
+        
+        records = [r for r in self._records(entity_type, row[1], retired_only) if self._matches(r, filters)]
+        
+        # sort by each key in turn, least significant first, relying on the sort being stable
+        sorts.reverse()
+        for field_name, descending in sorts:
+            records.sort(key=lambda r: self._sort_key(r.get(field_name)), reverse=descending)
+        
+        if page:
+            per_page = self.sg.records_per_page
+            if limit and limit <= per_page:
+                per_page = limit
+            records = records[(page - 1) * per_page:page * per_page]
+        elif limit:
+            records = records[:limit]
+        
+        results = []
+        for r in records:
+            result = {'type': r['type'], 'id': r['id']}
+            for f in fields:
+                result[f] = copy.deepcopy(r.get(f))
+            results.append(result)
+        return results
+    
+    def _records(self, entity_type, synced_at, retired):
+        """
+        Return the replicated entities of entity_type, loading them from the database if they aren't in memory
+        yet or have been synced since they were loaded.
+        """
+        self._lock.acquire()
+        try:
+            loaded = self._loaded.get(entity_type)
+            if loaded is None or loaded[0] != synced_at:
+                records = {False: [], True: []}
+                cursor = self._db.execute("SELECT retired, data FROM replica_entities WHERE entity_type = ? "
+                                          "ORDER BY id", (entity_type,))
+                for is_retired, data in cursor:
+                    records[bool(is_retired)].append(self._decode(cPickle.loads(str(data))))
+                loaded = (synced_at, records)
+                self._loaded[entity_type] = loaded
+        finally:
+            self._lock.release()
+        return loaded[1][bool(retired)]
+    
+    def _encode(self, value):
+        # datetimes are stored naive in UTC, the timezone objects can't be pickled
+        if isinstance(value, datetime.datetime) and value.tzinfo is not None:
+            return value.astimezone(sg_timezone.utc).replace(tzinfo=None)
+        if isinstance(value, dict):
+            return dict([(k, self._encode(v)) for k, v in value.items()])
+        if isinstance(value, list):
+            return [self._encode(v) for v in value]
+        return value
+    
+    def _decode(self, value):
+        if isinstance(value, datetime.datetime) and self.sg.convert_datetimes_to_utc:
+            return value.replace(tzinfo=sg_timezone.utc).astimezone(sg_timezone.local)
+        if isinstance(value, dict):
+            return dict([(k, self._decode(v)) for k, v in value.items()])
+        if isinstance(value, list):
+            return [self._decode(v) for v in value]
+        return value
+    
+    def _check_filters(self, filters, available):
+        for condition in filters["conditions"]:
+            if "conditions" in condition:
+                self._check_filters(condition, available)
+            elif condition["path"] not in available or condition["relation"] not in self.relations:
+                raise _ReplicaMiss()
+    
+    def _matches(self, record, filters):
+        if filters["logical_operator"] == "and":
+            for condition in filters["conditions"]:
+                if not self._matches_condition(record, condition):
+                    return False
+            return True
+        else:
+            for condition in filters["conditions"]:
+                if self._matches_condition(record, condition):
+                    return True
+            return False
+    
+    def _matches_condition(self, record, condition):
+        if "conditions" in condition:
+            return self._matches(record, condition)
+        
+        relation = condition["relation"]
+        value = self._comparable(record.get(condition["path"]))
+        values = condition["values"]
+        if relation in ("in", "not_in") and len(values) == 1 and type(values[0]) in (list, tuple):
+            values = values[0]
+        values = [self._comparable(v) for v in values]
+        
+        # multi-entity fields match when any of their entities does
+        if type(value) == list and relation not in ("is_not", "not_in", "not_contains"):
+            for v in value:
+                if self._compare(relation, v, values):
+                    return True
+            return False
+        elif type(value) == list:
+            for v in value:
+                if not self._compare(relation, v, values):
+                    return False
+            return True
+        return self._compare(relation, value, values)
+    
+    def _compare(self, relation, value, values):
+        if relation == "is":
+            return value == values[0]
+        if relation == "is_not":
+            return value != values[0]
+        if relation == "in":
+            return value in values
+        if relation == "not_in":
+            return value not in values
+        if value is None:
+            return relation == "not_contains"
+        try:
+            if relation == "less_than":
+                return value < values[0]
+            if relation == "greater_than":
+                return value > values[0]
+            if relation == "between":
+                return values[0] <= value <= values[1]
+        except TypeError:
+            raise _ReplicaMiss()
+        if not isinstance(value, basestring) or not isinstance(values[0], basestring):
+            raise _ReplicaMiss()
+        if relation == "contains":
+            return values[0] in value
+        if relation == "not_contains":
+            return values[0] not in value
+        if relation == "starts_with":
+            return value.startswith(values[0])
+        if relation == "ends_with":
+            return value.endswith(values[0])
+    
+    def _comparable(self, value):
+        """
+        Reduce a field or filter value to something that compares the way the server compares it: entities by
+        type and id, text ignoring case and datetimes in naive UTC.
+        """
+        if isinstance(value, dict):
+            if 'type' in value and 'id' in value:
+                return (value['type'], value['id'])
+            raise _ReplicaMiss()
+        if isinstance(value, basestring):
+            return value.lower()
+        if isinstance(value, datetime.datetime):
+            if value.tzinfo is None and self.sg.convert_datetimes_to_utc:
+                value = value.replace(tzinfo=sg_timezone.local)
+            if value.tzinfo is not None:
+                value = value.astimezone(sg_timezone.utc).replace(tzinfo=None)
+            return value
+        if isinstance(value, list):
+            return [self._comparable(v) for v in value]
+        return value
+    
+    def _sort_key(self, value):
+        # entities sort by name, and empty values before anything else
+        if isinstance(value, dict):
+            value = value.get('name')
+        value = self._comparable(value)
+        return (value is not None, value)
+
+class _Flight(object):
+    # a call in progress and the threads waiting for its result
+    def __init__(self):
+        self.done = threading.Event()
+        self.waiters = 0
+        self.results = []
+        self.error = None
+
+class SingleFlight(object):
+    """
+    Coalesces identical calls made at the same time.  The first caller for a key makes the call, and callers that
+    ask for the same key before it finishes wait for it and get their own deep copy of its result (or the same
+    exception), instead of making the call again.  Nothing is kept once the call has finished.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+    
+    def do(self, key, func, *args):
+        self._lock.acquire()
+        try:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                flight.waiters += 1
+        finally:
+            self._lock.release()
+        
+        if not leader:
+            flight.done.wait()
+            if flight.error:
+                raise flight.error[0], flight.error[1], flight.error[2]
+            return flight.results.pop()
+        
+        try:
+            result = func(*args)
+        except:
+            flight.error = sys.exc_info()
+        
+        self._lock.acquire()
+        try:
+            del self._flights[key]
+        finally:
+            self._lock.release()
+        
+        # the copies are made before anyone gets the result, so nobody can change it while it's being copied
+        if not flight.error:
+            for i in range(flight.waiters):
+                flight.results.append(copy.deepcopy(result))
+        flight.done.set()
+        
+        if flight.error:
+            raise flight.error[0], flight.error[1], flight.error[2]
+        return result
+
+# shared by every ShotgunCRUD with coalesce_reads on
+_read_flights = SingleFlight()
+
+class _ThumbnailBatch(object):
+    # thumbnail urls for a set of entities, looked up together the first time one of them is needed
+    def __init__(self, sg, entities):
+        self._sg = sg
+        self._entities = entities
+        self._urls = None
+        self._lock = threading.Lock()
+    
+    def url(self, key):
+        self._lock.acquire()
+        try:
+            if self._urls is None:
+                self._urls = self._sg._get_thumb_urls(self._entities)
+                self._sg = self._entities = None
+        finally:
+            self._lock.release()
+        return self._urls[key]
+
+class LazyThumbnailUrl(object):
+    """
+    Stands in for a thumbnail url in results when Shotgun.lazy_thumbnail_urls is on.  It's true without looking
+    anything up, so checking whether an entity has a thumbnail costs nothing.  The url is looked up, together
+    with those of the other entities from the same result, the first time it's converted to a string, compared,
+    or used like one (url.startswith(...) etc.).  Pickling it gives the url itself.
+    """
+    __slots__ = ('_batch', '_key')
+    
+    def __init__(self, batch, key):
+        self._batch = batch
+        self._key = key
+    
+    def resolve(self):
+        return self._batch.url(self._key)
+    
+    def __str__(self):
+        return self.resolve()
+    
+    def __repr__(self):
+        return repr(self.resolve())
+    
+    def __nonzero__(self):
+        return True
+    
+    def __eq__(self, other):
+        if isinstance(other, LazyThumbnailUrl):
+            other = other.resolve()
+        return self.resolve() == other
+    
+    def __ne__(self, other):
+        return not self.__eq__(other)
+    
+    def __hash__(self):
+        return hash(self.resolve())
+    
+    def __len__(self):
+        return len(self.resolve())
+    
+    def __contains__(self, item):
+        return item in self.resolve()
+    
+    def __getitem__(self, index):
+        return self.resolve()[index]
+    
+    def __add__(self, other):
+        return self.resolve() + other
+    
+    def __radd__(self, other):
+        return other + self.resolve()
+    
+    def __getattr__(self, name):
+        return getattr(self.resolve(), name)
+    
+    # it never changes, so copies (made by the result cache, for example) can share it and stay lazy
+    def __copy__(self):
+        return self
+    
+    def __deepcopy__(self, memo):
+        return self
+    
+    def __reduce__(self):
+        return (str, (self.resolve(),))
+
+class ConnectionPool(object):
+    """
+    Thread-safe pool of connections to the server (ShotgunCRUD objects, or plain http connections), made by
+    calling factory.  Every connection has its own keep-alive http connection, so requests made through different
+    members of the pool can be in flight at the same time.
+    """
+    def __init__(self, factory):
+        self._factory = factory
+        self._idle = []
+        self._lock = threading.Lock()
+    
+    def acquire(self):
+        """
+        Return an idle connection, creating a new one if they are all in use.
+        """
+        self._lock.acquire()
+        try:
+            if self._idle:
+                return self._idle.pop()
+        finally:
+            self._lock.release()
+        return self._factory()
+    
+    def release(self, conn):
+        self._lock.acquire()
+        try:
+            self._idle.append(conn)
+        finally:
+            self._lock.release()
+    
+    def call(self, func, *args):
+        """
+        Call func(conn, *args) with a connection from the pool and return its result.
         """
-        if self.sid == None:
-            # HACK: use API2 to get token for now until we better resolve how we manage Attachments in general
-            api2_url = "%s/%s/" % (self.base_url, 'api2')
-            conn = ServerProxy(api2_url)
-            self.sid = conn.getSessionToken([self.script_name, self.api_key])['session_id']
-        return self.sid
-    
-    # Deprecated methods from old wrapper
-    def schema(self, entity_type):
-        raise ShotgunError("Deprecated: use schema_field_read('type':'%s') instead" % entity_type)
+        conn = self.acquire()
+        try:
+            return func(conn, *args)
+        finally:
+            self.release(conn)
     
-    def entity_types(self):
-        raise ShotgunError("Deprecated: use schema_entity_read() instead")
-
-class ShotgunCRUD(object):
-    def __init__(self, options):
-        self.__sg_url = options['server_url']
-        self.__auth_args = {'script_name': options['script_name'], 'script_key': options['script_key']}
+    def map(self, func, items, max_connections):
+        """
+        Call func(conn, item) for every item, using up to max_connections connections at once, and return the
+        results in the same order as items.  The first exception raised by any call is re-raised here once all the
+        calls in progress have finished.
+        """
+        items = list(items)
+        results = [None] * len(items)
+        work = Queue.Queue()
+        for i, item in enumerate(items):
+            work.put((i, item))
+        errors = []
         
-        if 'session_uuid' in options:
-            self.__auth_args['session_uuid'] = options['session_uuid']
+        def worker():
+            conn = self.acquire()
+            try:
+                while not errors:
+                    try:
+                        i, item = work.get_nowait()
+                    except Queue.Empty:
+                        break
+                    try:
+                        results[i] = func(conn, item)
+                    except:
+                        errors.append(sys.exc_info())
+            finally:
+                self.release(conn)
         
-        if 'convert_datetimes_to_utc' in options:
-            convert_datetimes_to_utc = options['convert_datetimes_to_utc']
-        else:
-            convert_datetimes_to_utc = 1
-        if 'error_stream' in options:
-            self.__err_stream = options['error_stream']
-        else:
-            self.__err_stream = 'sys.stderr'
-        if 'http_proxy' in options and options['http_proxy']:
-            p = ProxiedTransport()
-            p.set_proxy( options['http_proxy'] )
-            self.__sg = ServerProxy(self.__sg_url, convert_datetimes_to_utc = convert_datetimes_to_utc, transport=p)
-        else:
-            self.__sg = ServerProxy(self.__sg_url, convert_datetimes_to_utc = convert_datetimes_to_utc)
-    
-    def __getattr__(self, attr):
-        def callable(*args, **kwargs):
-            return self.meta_caller(attr, *args, **kwargs)
-        return callable
-    
-    def info(self):
+        threads = []
+        for i in range(min(max(max_connections, 1), len(items))):
+            t = threading.Thread(target=worker)
+            t.setDaemon(True)
+            t.start()
+            threads.append(t)
+        for t in threads:
+            t.join()
+        
+        if errors:
+            raise errors[0][0], errors[0][1], errors[0][2]
+        return results
+
+class _BackgroundCall(object):
+    """
+    Run func(*args) in a background thread.  result() waits for it to finish and returns its value, or re-raises
+    the exception it raised.
+    """
+    def __init__(self, func, *args):
+        self._value = None
+        self._error = None
+        self._thread = threading.Thread(target=self._run, args=(func, args))
+        self._thread.setDaemon(True)
+        self._thread.start()
+    
+    def _run(self, func, args):
         try:
-            server_info = self.__sg.info()
+            self._value = func(*args)
         except:
-            server_info = {}
-        
-        return server_info
+            self._error = sys.exc_info()
     
-    def meta_caller(self, attr, *args, **kwargs):
-        try:
-            return eval(
-                'self._%s__sg.%s(self._%s__auth_args, *args, **kwargs)' %
-                (self.__class__.__name__, attr, self.__class__.__name__)
-            )
-        except Fault, e:
-            if self.__err_stream:
-                eval('%s.write("\\n" + "-"*80 + "\\n")' % self.__err_stream)
-                eval('%s.write("XMLRPC Fault %s:\\n")' % (self.__err_stream, e.faultCode))
-                eval('%s.write(e.faultString)' % self.__err_stream)
-                eval('%s.write("\\n" + "-"*80 + "\\n")' % self.__err_stream)
-            raise
+    def result(self):
+        self._thread.join()
+        if self._error:
+            raise self._error[0], self._error[1], self._error[2]
+        return self._value
 
 # Based on http://code.activestate.com/recipes/146306/
 class FormPostHandler(urllib2.BaseHandler):
@@ -827,6 +3129,17 @@ class SgTimezone(object):
     
     class LocalTimezone(tzinfo):
         
+        # Whether DST is in effect is remembered by the hour, for hours it's the same at the start and the end of.
+        # Hours with a change in them (which needn't be on the UTC hour, in half hour zones) are worked out for
+        # every value.  The caches are emptied once they hold max_hours hours.
+        max_hours = 100000
+        
+        def __init__(self):
+            # (year, month, day, hour) in local time => is DST
+            self._dst_hours = {}
+            # (year, month, day, hour) in UTC => is DST
+            self._utc_offsets = {}
+        
         def utcoffset(self, dt):
             if self._isdst(dt):
                 return DSTOFFSET
@@ -842,11 +3155,39 @@ class SgTimezone(object):
         def tzname(self, dt):
             return _time.tzname[self._isdst(dt)]
         
+        def fromutc(self, dt):
+            # convert a UTC time (with this tzinfo) to local time
+            key = (dt.year, dt.month, dt.day, dt.hour)
+            isdst = self._utc_offsets.get(key)
+            if isdst is None:
+                stamp = calendar.timegm((dt.year, dt.month, dt.day, dt.hour, 0, 0))
+                isdst = _time.localtime(stamp).tm_isdst > 0
+                if isdst == (_time.localtime(stamp + 3599).tm_isdst > 0):
+                    if len(self._utc_offsets) >= self.max_hours:
+                        self._utc_offsets.clear()
+                    self._utc_offsets[key] = isdst
+                else:
+                    isdst = _time.localtime(stamp + dt.minute * 60 + dt.second).tm_isdst > 0
+            if isdst:
+                return dt + DSTOFFSET
+            return dt + STDOFFSET
+        
         def _isdst(self, dt):
-            tt = (dt.year, dt.month, dt.day, dt.hour, dt.minute, dt.second, dt.weekday(), 0, -1)
-            stamp = _time.mktime(tt)
-            tt = _time.localtime(stamp)
-            return tt.tm_isdst > 0
+            key = (dt.year, dt.month, dt.day, dt.hour)
+            isdst = self._dst_hours.get(key)
+            if isdst is None:
+                isdst = self._isdst_at(dt.year, dt.month, dt.day, dt.hour, dt.minute, dt.second, dt.weekday())
+                start = self._isdst_at(dt.year, dt.month, dt.day, dt.hour, 0, 0, dt.weekday())
+                end = self._isdst_at(dt.year, dt.month, dt.day, dt.hour, 59, 59, dt.weekday())
+                if start == end == isdst:
+                    if len(self._dst_hours) >= self.max_hours:
+                        self._dst_hours.clear()
+                    self._dst_hours[key] = isdst
+            return isdst
+        
+        def _isdst_at(self, year, month, day, hour, minute, second, weekday):
+            stamp = _time.mktime((year, month, day, hour, minute, second, weekday, 0, -1))
+            return _time.localtime(stamp).tm_isdst > 0
 
 sg_timezone = SgTimezone()
 
@@ -998,6 +3339,7 @@ from types import *
 import socket
 import errno
 import httplib
+import zlib
 
 # --------------------------------------------------------------------
 # Internal stuff
@@ -1018,20 +3360,38 @@ try:
 except NameError:
     _bool_is_builtin = 0
 
-def _decode(data, encoding, is8bit=re.compile("[\x80-\xff]").search):
+_all_chars = string.maketrans("", "")
+_8bit_chars = _all_chars[128:]
+
+def _is8bit(data, search=re.compile("[\x80-\xff]").search):
+    # true if data has any non-ascii characters.  The regular expression is quickest on short strings, dropping
+    # the 8-bit characters and comparing lengths is several times quicker on long ones.
+    if len(data) < 32 or type(data) is not StringType:
+        return search(data) is not None
+    return len(data.translate(_all_chars, _8bit_chars)) != len(data)
+
+def _decode(data, encoding):
     # decode non-ascii string (if possible)
-    if unicode and encoding and is8bit(data):
+    if unicode and encoding and _is8bit(data):
         data = unicode(data, encoding)
     return data
 
-def escape(s, replace=string.replace):
-    s = replace(s, "&", "&amp;")
-    s = replace(s, "<", "&lt;")
-    return replace(s, ">", "&gt;",)
+def escape(s):
+    # most strings have nothing to escape, and looking is much quicker than replacing
+    if "&" in s:
+        s = s.replace("&", "&amp;")
+    if "<" in s:
+        s = s.replace("<", "&lt;")
+    if ">" in s:
+        s = s.replace(">", "&gt;")
+    return s
 
 if unicode:
     def _stringify(string):
         # convert to 7-bit ascii if possible
+        if type(string) is StringType:
+            # already is, or can't be
+            return string
         try:
             return string.encode("ascii")
         except UnicodeError:
@@ -1263,9 +3623,28 @@ def _datetime(data):
     return value
 
 def _datetime_type(data):
+    # values from the server are always YYYYMMDDTHH:MM:SS, which is much quicker to slice up than to strptime
+    if len(data) == 17 and data[8] == "T" and data[11] == ":" and data[14] == ":":
+        try:
+            return datetime.datetime(int(data[:4]), int(data[4:6]), int(data[6:8]),
+                                     int(data[9:11]), int(data[12:14]), int(data[15:17]))
+        except ValueError:
+            pass
     t = time.strptime(data, "%Y%m%dT%H:%M:%S")
     return datetime.datetime(*tuple(t)[:6])
 
+def _outgoing_datetime(value, convert_datetimes_to_utc):
+    # a datetime or time as it's sent to the server.  Times are sent as that time today, and naive datetimes are in
+    # local time
+    if not isinstance(value, datetime.datetime):
+        value = datetime.datetime.combine(datetime.date.today(), value)
+    if convert_datetimes_to_utc:
+        if value.tzinfo == None:
+            value = value - sg_timezone.local.utcoffset(value)
+        else:
+            value = value.astimezone(sg_timezone.utc)
+    return value
+
 ##
 # Wrapper for binary data.  This can be used to transport any kind
 # of binary data over XML-RPC, using BASE64 encoding.
@@ -1395,6 +3774,13 @@ else:
         def __init__(self, target):
             self._parser = parser = expat.ParserCreate(None, None)
             self._target = target
+            # hand over the text of each element in one piece rather than line by line, as utf-8 rather than
+            # unicode so plain ascii text doesn't have to be converted back
+            try:
+                parser.buffer_text = 1
+                parser.returns_unicode = 0
+            except AttributeError:
+                pass
             parser.StartElementHandler = target.start
             parser.EndElementHandler = target.end
             parser.CharacterDataHandler = target.data
@@ -1451,18 +3837,29 @@ class Marshaller:
     # by the way, if you don't understand what's going on in here,
     # that's perfectly ok.
     
-    def __init__(self, encoding=None, allow_none=1, convert_datetimes_to_utc=1):
+    def __init__(self, encoding=None, allow_none=1, convert_datetimes_to_utc=1, check_recursion=1):
         self.memo = {}
         self.data = None
         self.encoding = encoding
         self.allow_none = allow_none
         self.convert_datetimes_to_utc = convert_datetimes_to_utc
+        # payloads that can't contain themselves can skip the checks for recursive lists and dicts
+        self.check_recursion = check_recursion
     
     dispatch = {}
     
+    # struct key => the xml that starts a member with that key, shared by all marshallers
+    member_starts = {}
+    max_member_starts = 10000
+    
     def dumps(self, values):
         out = []
-        write = out.append
+        self.write_values(values, out.append)
+        result = string.join(out, "")
+        return result
+    
+    def write_values(self, values, write):
+        # like dumps, but hands the chunks to write as they're made
         dump = self.__dump
         if isinstance(values, Fault):
             # fault instance
@@ -1484,8 +3881,6 @@ class Marshaller:
                 dump(v, write)
                 write("</param>\n")
             write("</params>\n")
-        result = string.join(out, "")
-        return result
     
     def __dump(self, value, write):
         try:
@@ -1545,50 +3940,87 @@ class Marshaller:
             write("</string></value>\n")
         dispatch[UnicodeType] = dump_unicode
     
-    def dump_array(self, value, write):
-        i = id(value)
-        if self.memo.has_key(i):
-            raise TypeError, "cannot marshal recursive sequences"
-        self.memo[i] = None
+    def dump_array(self, value, write, escape=escape):
+        check_recursion = self.check_recursion
+        if check_recursion:
+            i = id(value)
+            if self.memo.has_key(i):
+                raise TypeError, "cannot marshal recursive sequences"
+            self.memo[i] = None
         dump = self.__dump
+        dispatch = self.dispatch
         write("<value><array><data>\n")
         for v in value:
-            dump(v, write)
+            # strings and ints are written inline, everything else is dispatched
+            t = type(v)
+            if t is StringType:
+                write("<value><string>%s</string></value>\n" % escape(v))
+            elif t is IntType and MININT <= v <= MAXINT:
+                write("<value><int>%d</int></value>\n" % v)
+            elif t in dispatch:
+                dispatch[t](self, v, write)
+            else:
+                dump(v, write)
         write("</data></array></value>\n")
-        del self.memo[i]
+        if check_recursion:
+            del self.memo[i]
     dispatch[TupleType] = dump_array
     dispatch[ListType] = dump_array
     
     def dump_struct(self, value, write, escape=escape):
-        i = id(value)
-        if self.memo.has_key(i):
-            raise TypeError, "cannot marshal recursive dictionaries"
-        self.memo[i] = None
+        check_recursion = self.check_recursion
+        if check_recursion:
+            i = id(value)
+            if self.memo.has_key(i):
+                raise TypeError, "cannot marshal recursive dictionaries"
+            self.memo[i] = None
         dump = self.__dump
+        dispatch = self.dispatch
+        member_starts = self.member_starts
         write("<value><struct>\n")
         for k, v in value.items():
-            write("<member>\n")
-            if type(k) is not StringType:
-                if unicode and type(k) is UnicodeType:
-                    k = k.encode(self.encoding)
+            start = member_starts.get(k)
+            if start is None:
+                start = self.member_start(k)
+            # strings, ints and None are written inline with the member, everything else is dispatched
+            t = type(v)
+            if t is StringType:
+                write("%s<value><string>%s</string></value>\n</member>\n" % (start, escape(v)))
+            elif t is IntType and MININT <= v <= MAXINT:
+                write("%s<value><int>%d</int></value>\n</member>\n" % (start, v))
+            elif v is None and self.allow_none:
+                write("%s<value><nil/></value></member>\n" % (start))
+            else:
+                write(start)
+                if t in dispatch:
+                    dispatch[t](self, v, write)
                 else:
-                    raise TypeError, "dictionary key must be string"
-            write("<name>%s</name>\n" % escape(k))
-            dump(v, write)
-            write("</member>\n")
+                    dump(v, write)
+                write("</member>\n")
         write("</struct></value>\n")
-        del self.memo[i]
+        if check_recursion:
+            del self.memo[i]
     dispatch[DictType] = dump_struct
     
+    def member_start(self, k, escape=escape):
+        # return the xml that starts a struct member with key k
+        key = k
+        if type(k) is not StringType:
+            if unicode and type(k) is UnicodeType:
+                k = k.encode(self.encoding)
+            else:
+                raise TypeError, "dictionary key must be string"
+        start = "<member>\n<name>%s</name>\n" % escape(k)
+        # unicode keys depend on the encoding, so only plain strings are remembered
+        if type(key) is StringType and len(self.member_starts) < self.max_member_starts:
+            self.member_starts[key] = start
+        return start
+    
     if datetime:
         def dump_datetime(self, value, write):
-            if self.convert_datetimes_to_utc:
-                if value.tzinfo == None:
-                    value = value.replace(tzinfo = sg_timezone.local)
-                value = value.astimezone(sg_timezone.utc)
-            write("<value><dateTime.iso8601>")
-            write(value.strftime("%Y%m%dT%H:%M:%S"))
-            write("</dateTime.iso8601></value>\n")
+            value = _outgoing_datetime(value, self.convert_datetimes_to_utc)
+            write("<value><dateTime.iso8601>%04d%02d%02dT%02d:%02d:%02d</dateTime.iso8601></value>\n" %
+                  (value.year, value.month, value.day, value.hour, value.minute, value.second))
         dispatch[datetime.datetime] = dump_datetime
         
         def dump_date(self, value, write):
@@ -1597,16 +4029,7 @@ class Marshaller:
             write("</dateTime.iso8601></value>\n")
         dispatch[datetime.date] = dump_date
         
-        def dump_time(self, value, write):
-            if self.convert_datetimes_to_utc:
-                if value.tzinfo == None:
-                    value = value.replace(tzinfo = sg_timezone.local)
-                value = value.astimezone(sg_timezone.utc)
-            write("<value><dateTime.iso8601>")
-            write(datetime.datetime.now().date().strftime("%Y%m%dT"))
-            write(value.strftime("%H:%M:%S"))
-            write("</dateTime.iso8601></value>\n")
-        dispatch[datetime.time] = dump_time
+        dispatch[datetime.time] = dump_datetime
     
     def dump_instance(self, value, write):
         # check for special wrappers
@@ -1619,6 +4042,41 @@ class Marshaller:
             self.dump_struct(value.__dict__, write)
     dispatch[InstanceType] = dump_instance
 
+##
+# Values shared between the structs and strings decoded by
+# Unmarshallers.  One is made per response, or shared by all the
+# responses read by a Shotgun object.
+
+class DecodeMemo:
+    """Equal strings and entity links decoded with the same memo are
+    returned as the same object.  Strings longer than max_string_length
+    aren't shared, and everything is forgotten once more than
+    max_entries strings or links have been seen.
+    """
+    
+    max_string_length = 64
+    max_entries = 200000
+    
+    def __init__(self):
+        self.strings = {}
+        self.links = {}
+    
+    def trim(self):
+        if len(self.strings) > self.max_entries:
+            self.strings.clear()
+        if len(self.links) > self.max_entries:
+            self.links.clear()
+    
+    def share_link(self, struct):
+        # entity links are {'type', 'id'} with an optional 'name'; anything else is returned as it is
+        n = len(struct)
+        if (n == 2 or n == 3 and "name" in struct) and "type" in struct and "id" in struct:
+            try:
+                return self.links.setdefault((n, struct["type"], struct["id"], struct.get("name")), struct)
+            except TypeError:
+                pass # unhashable value, can't be shared
+        return struct
+
 ##
 # XML-RPC unmarshaller.
 #
@@ -1636,7 +4094,7 @@ class Unmarshaller:
     # and again, if you don't understand what's going on in here,
     # that's perfectly ok.
     
-    def __init__(self, use_datetime=1, convert_datetimes_to_utc=1):
+    def __init__(self, use_datetime=1, convert_datetimes_to_utc=1, decode_memo=None):
         self._type = None
         self._stack = []
         self._marks = []
@@ -1646,11 +4104,18 @@ class Unmarshaller:
         self.append = self._stack.append
         self._use_datetime = use_datetime
         self._convert_datetimes_to_utc = convert_datetimes_to_utc
+        self._memo = decode_memo
+        if decode_memo is not None:
+            self._strings = decode_memo.strings
+            self._share_link = decode_memo.share_link
+            self._max_string_length = decode_memo.max_string_length
         if use_datetime and not datetime:
             raise ValueError, "the datetime module is not available"
     
     def close(self):
         # return response tuple and target method
+        if self._memo is not None:
+            self._memo.trim()
         if self._type is None or self._marks:
             raise ResponseError()
         if self._type == "fault":
@@ -1730,12 +4195,31 @@ class Unmarshaller:
     dispatch["double"] = end_double
     
     def end_string(self, data):
-        if self._encoding:
-            data = _decode(data, self._encoding)
-        self.append(_stringify(data))
+        # plain ascii strings are already what they should be, and others can't become ascii
+        if type(data) is not StringType:
+            data = _stringify(data)
+        elif self._encoding and _is8bit(data):
+            data = unicode(data, self._encoding)
+        if self._memo is not None and len(data) <= self._max_string_length:
+            data = self._strings.setdefault(data, data)
+        self.append(data)
         self._value = 0
     dispatch["string"] = end_string
-    dispatch["name"] = end_string # struct keys are always strings
+    
+    def _name(self, data):
+        # struct keys are always strings, and there are few of them
+        if type(data) is not StringType:
+            data = _stringify(data)
+        elif self._encoding and _is8bit(data):
+            data = unicode(data, self._encoding)
+        if self._memo is not None:
+            data = self._strings.setdefault(data, data)
+        return data
+    
+    def end_name(self, data):
+        self.append(self._name(data))
+        self._value = 0
+    dispatch["name"] = end_name
     
     def end_array(self, data):
         mark = self._marks.pop()
@@ -1750,7 +4234,10 @@ class Unmarshaller:
         dict = {}
         items = self._stack[mark:]
         for i in range(0, len(items), 2):
-            dict[_stringify(items[i])] = items[i+1]
+            # keys have already been through end_name()
+            dict[items[i]] = items[i+1]
+        if self._memo is not None:
+            dict = self._share_link(dict)
         self._stack[mark:] = [dict]
         self._value = 0
     dispatch["struct"] = end_struct
@@ -1795,6 +4282,108 @@ class Unmarshaller:
         self._type = "methodName" # no params
     dispatch["methodName"] = end_methodName
 
+##
+# XML-RPC unmarshaller that adds values straight to the list or dict
+# they belong to as they're decoded, instead of stacking them all up
+# and building the containers from marks when they end.
+#
+# @see getparser
+
+class DirectUnmarshaller(Unmarshaller):
+    """Same as Unmarshaller, only faster.  self.append always adds to
+    the innermost open array or struct (or to the results at the top
+    level), so the scalar decoders are shared with Unmarshaller.
+    """
+    
+    def __init__(self, use_datetime=1, convert_datetimes_to_utc=1, decode_memo=None):
+        Unmarshaller.__init__(self, use_datetime, convert_datetimes_to_utc, decode_memo)
+        # (append, container, key) of the enclosing arrays and structs
+        self._parents = []
+        self._container = None
+        self._key = None
+        # text since the last start tag, collected without a python level data() call
+        self._chunks = []
+        self.data = self._chunks.append
+    
+    def close(self):
+        if self._memo is not None:
+            self._memo.trim()
+        if self._type is None or self._parents:
+            raise ResponseError()
+        if self._type == "fault":
+            raise Fault(**self._stack[0])
+        return tuple(self._stack)
+    
+    def start(self, tag, attrs):
+        if tag == "struct":
+            self._parents.append((self.append, self._container, self._key))
+            self._container = {}
+            self.append = self._add_member
+        elif tag == "array":
+            self._start_array()
+        del self._chunks[:]
+        self._value = (tag == "value")
+    
+    def _start_array(self):
+        self._parents.append((self.append, self._container, self._key))
+        self._container = values = []
+        self.append = values.append
+    
+    def end(self, tag):
+        if tag == "value":
+            # most values have already been handled by their type's tag
+            if self._value:
+                self.end_string("".join(self._chunks))
+            return
+        f = self.dispatch.get(tag)
+        if f is not None:
+            return f(self, "".join(self._chunks))
+    
+    def _add_member(self, value):
+        self._container[self._key] = value
+    
+    dispatch = Unmarshaller.dispatch.copy()
+    
+    def end_name(self, data):
+        # the key of the member whose value comes next
+        self._key = self._name(data)
+        self._value = 0
+    dispatch["name"] = end_name
+    
+    def end_array(self, data):
+        values = self._container
+        self.append, self._container, self._key = self._parents.pop()
+        self.append(values)
+        self._value = 0
+    dispatch["array"] = end_array
+    
+    def end_struct(self, data):
+        struct = self._container
+        self.append, self._container, self._key = self._parents.pop()
+        if self._memo is not None:
+            struct = self._share_link(struct)
+        self.append(struct)
+        self._value = 0
+    dispatch["struct"] = end_struct
+
+class StreamingUnmarshaller(DirectUnmarshaller):
+    """DirectUnmarshaller for read responses, which moves each entity
+    of results.entities to the entities list as soon as it has been
+    decoded, instead of adding it to the response.  Whoever feeds the
+    parser can take them from there as the response arrives, and the
+    response close() returns has an empty entities list.
+    """
+    
+    def __init__(self, use_datetime=1, convert_datetimes_to_utc=1, decode_memo=None):
+        DirectUnmarshaller.__init__(self, use_datetime, convert_datetimes_to_utc, decode_memo)
+        self.entities = []
+    
+    def _start_array(self):
+        DirectUnmarshaller._start_array(self)
+        # the entities array is the 'entities' member of the 'results' member of the response
+        if len(self._parents) == 3 and self._key == "entities" and self._parents[1][2] == "results":
+            self.append = self.entities.append
+
 ## Multicall support
 #
 
@@ -1871,15 +4460,17 @@ class MultiCall:
 #
 # return A (parser, unmarshaller) tuple.
 
-def getparser(use_datetime=1, convert_datetimes_to_utc=1):
+def getparser(use_datetime=1, convert_datetimes_to_utc=1, decode_memo=None, stream_entities=0):
     """getparser() -> parser, unmarshaller
     
     Create an instance of the fastest available parser, and attach it
-    to an unmarshalling object.  Return both objects.
+    to an unmarshalling object.  Return both objects.  decode_memo, a
+    DecodeMemo, makes the unmarshaller share equal values.  With
+    stream_entities, the unmarshaller is a StreamingUnmarshaller.
     """
     if use_datetime and not datetime:
         raise ValueError, "the datetime module is not available"
-    if FastParser and FastUnmarshaller:
+    if FastParser and FastUnmarshaller and not stream_entities:
         if use_datetime:
             mkdatetime = _datetime_type
         else:
@@ -1887,7 +4478,12 @@ def getparser(use_datetime=1, convert_datetimes_to_utc=1):
         target = FastUnmarshaller(True, False, _binary, mkdatetime, Fault)
         parser = FastParser(target)
     else:
-        target = Unmarshaller(use_datetime=use_datetime, convert_datetimes_to_utc=convert_datetimes_to_utc)
+        if stream_entities:
+            unmarshaller = StreamingUnmarshaller
+        else:
+            unmarshaller = DirectUnmarshaller
+        target = unmarshaller(use_datetime=use_datetime, convert_datetimes_to_utc=convert_datetimes_to_utc,
+                              decode_memo=decode_memo)
         if FastParser:
             parser = FastParser(target)
         elif SgmlopParser:
@@ -1912,7 +4508,7 @@ def getparser(use_datetime=1, convert_datetimes_to_utc=1):
 # @return A string containing marshalled data.
 
 def dumps(params, methodname=None, methodresponse=None, encoding=None,
-          allow_none=1, convert_datetimes_to_utc=1):
+          allow_none=1, convert_datetimes_to_utc=1, check_recursion=1):
     """data [,options] -> marshalled data
     
     Convert an argument tuple or a Fault instance to an XML-RPC
@@ -1928,6 +4524,9 @@ def dumps(params, methodname=None, methodresponse=None, encoding=None,
         a singleton (i.e. it can contain only one element).
         
         encoding: the packet encoding (default is UTF-8)
+        
+        check_recursion: false to skip checking for lists and dicts
+        that contain themselves, when the data can't
     
     All 8-bit strings in the data structure are assumed to use the
     packet encoding.  Unicode strings are automatically converted,
@@ -1948,7 +4547,7 @@ def dumps(params, methodname=None, methodresponse=None, encoding=None,
     if FastMarshaller:
         m = FastMarshaller(encoding)
     else:
-        m = Marshaller(encoding, allow_none, convert_datetimes_to_utc)
+        m = Marshaller(encoding, allow_none, convert_datetimes_to_utc, check_recursion)
     
     data = m.dumps(params)
     
@@ -1981,6 +4580,160 @@ def dumps(params, methodname=None, methodresponse=None, encoding=None,
         return data # return as is
     return string.join(data, "")
 
+##
+# A method call that's marshalled as it's sent rather than in one go,
+# so large requests never exist in memory in full.
+#
+# @see ServerProxy
+
+class _BodyTooLarge(Exception):
+    pass
+
+class StreamingRequest:
+    """A methodCall request that's written to the connection as it's
+    marshalled.  It's marshalled again every time it's sent: once to
+    work out its length and once to send it, or just once with chunked
+    transfer encoding.  Requests that turn out to be no bigger than
+    buffer_size are kept in data, and can be sent like any other.
+    """
+    
+    # bytes written to the connection at a time
+    send_size = 64 * 1024
+    
+    def __init__(self, params, methodname, encoding=None, allow_none=1, convert_datetimes_to_utc=1,
+                 check_recursion=1, buffer_size=1024 * 1024):
+        self.params = params
+        self.methodname = methodname
+        self.encoding = encoding or "utf-8"
+        self.allow_none = allow_none
+        self.convert_datetimes_to_utc = convert_datetimes_to_utc
+        self.check_recursion = check_recursion
+        
+        # marshal it in memory, as long as it stays small
+        out = []
+        self._size = 0
+        def write(chunk):
+            self._size += len(chunk)
+            if self._size > buffer_size:
+                raise _BodyTooLarge()
+            out.append(chunk)
+        try:
+            self.write(write)
+        except _BodyTooLarge:
+            self.data = None
+        else:
+            self.data = string.join(out, "")
+    
+    def write(self, write):
+        # hand the whole request to write, chunk by chunk
+        if self.encoding != "utf-8":
+            write("<?xml version='1.0' encoding='%s'?>\n" % str(self.encoding))
+        else:
+            write("<?xml version='1.0'?>\n")
+        methodname = self.methodname
+        if not isinstance(methodname, StringType):
+            methodname = methodname.encode(self.encoding)
+        write("<methodCall>\n<methodName>%s</methodName>\n" % methodname)
+        m = Marshaller(self.encoding, self.allow_none, self.convert_datetimes_to_utc, self.check_recursion)
+        m.write_values(self.params, write)
+        write("</methodCall>\n")
+    
+    def size(self):
+        # length of the request in bytes
+        if self.data is not None:
+            return len(self.data)
+        sizes = [0]
+        def count(chunk):
+            sizes[0] += len(chunk)
+        self.write(count)
+        return sizes[0]
+    
+    def compress(self):
+        # the whole request gzip compressed, which is small enough to
+        # keep in memory
+        out = []
+        write, close = _gzip_writer(out.append)
+        self.write(write)
+        close()
+        return string.join(out, "")
+    
+    def send(self, connection, chunked=0, compress=0):
+        """Write the request to a connection whose headers have been
+        sent.  With chunked, the request is framed with chunked transfer
+        encoding.  With compress, it's gzip compressed as it's written.
+        """
+        send_size = self.send_size
+        out = []
+        size = [0]
+        def flush():
+            data = string.join(out, "")
+            del out[:]
+            size[0] = 0
+            if not data:
+                return
+            if chunked:
+                connection.send("%x\r\n%s\r\n" % (len(data), data))
+            else:
+                connection.send(data)
+        def write(chunk):
+            out.append(chunk)
+            size[0] += len(chunk)
+            if size[0] >= send_size:
+                flush()
+        if compress:
+            write, close = _gzip_writer(write)
+            self.write(write)
+            close()
+        else:
+            self.write(write)
+        flush()
+        if chunked:
+            connection.send("0\r\n\r\n")
+
+def _gzip_writer(write):
+    # (write, close) functions that pass what's written to them on to
+    # write gzip compressed.  close writes what's left.
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    def gzip_write(data):
+        data = compressor.compress(data)
+        if data:
+            write(data)
+    def close():
+        write(compressor.flush())
+    return gzip_write, close
+
+def _gzip(data):
+    out = []
+    write, close = _gzip_writer(out.append)
+    write(data)
+    close()
+    return string.join(out, "")
+
+class _Decompressor:
+    # decompresses a gzip or deflate response body as it arrives
+    def __init__(self, encoding):
+        self._encoding = encoding
+        if encoding == "deflate":
+            self._decompressor = zlib.decompressobj()
+        else:
+            self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self._started = 0
+    
+    def decompress(self, data):
+        try:
+            data = self._decompressor.decompress(data)
+        except zlib.error:
+            # some servers send deflate without the zlib header around it
+            if self._encoding != "deflate" or self._started:
+                raise
+            self._decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+            data = self._decompressor.decompress(data)
+        self._started = 1
+        return data
+    
+    def flush(self):
+        return self._decompressor.flush()
+
 ##
 # Convert an XML-RPC packet to a Python object.  If the XML-RPC packet
 # represents a fault condition, this function raises a Fault exception.
@@ -2004,6 +4757,218 @@ def loads(data, use_datetime=1, convert_datetimes_to_utc=1):
     p.close()
     return u.close(), u.getmethodname()
 
+# --------------------------------------------------------------------
+# wire codecs
+
+##
+# Encodes requests and decodes responses for ServerProxy and Transport.
+# A codec has a content_type, a path (appended to the server url by
+# ShotgunCRUD), a dumps(params, methodname) method returning the
+# request body and a getparser(decode_memo, stream_entities) method
+# returning a (parser, unmarshaller) pair like the getparser function.
+# With stream_entities, the unmarshaller moves the entities of a read
+# response to its entities list as they're decoded.
+
+class XmlRpcCodec:
+    """Requests and responses as XML-RPC, which every Shotgun server
+    speaks.  Requests bigger than stream_request_bytes are sent as
+    StreamingRequests.
+    """
+    
+    content_type = "text/xml"
+    path = ""
+    
+    def __init__(self, encoding=None, allow_none=1, use_datetime=1, convert_datetimes_to_utc=1,
+                 check_recursion=1, stream_request_bytes=None):
+        self.encoding = encoding
+        self.allow_none = allow_none
+        self.use_datetime = use_datetime
+        self.convert_datetimes_to_utc = convert_datetimes_to_utc
+        self.check_recursion = check_recursion
+        self.stream_request_bytes = stream_request_bytes
+    
+    def dumps(self, params, methodname):
+        if self.stream_request_bytes:
+            request = StreamingRequest(params, methodname, self.encoding, self.allow_none,
+                                       self.convert_datetimes_to_utc, self.check_recursion,
+                                       self.stream_request_bytes)
+            if request.data is not None:
+                request = request.data
+            return request
+        return dumps(params, methodname, encoding=self.encoding, allow_none=self.allow_none,
+                     convert_datetimes_to_utc=self.convert_datetimes_to_utc, check_recursion=self.check_recursion)
+    
+    def getparser(self, decode_memo=None, stream_entities=0):
+        return getparser(use_datetime=self.use_datetime, convert_datetimes_to_utc=self.convert_datetimes_to_utc,
+                         decode_memo=decode_memo, stream_entities=stream_entities)
+
+class JsonCodec:
+    """Requests and responses as JSON, for servers with the /api3/json
+    endpoint.  It's several times smaller on the wire than XML-RPC and
+    decoded by the json module's C scanner.  Requests are sent as
+    {"method_name": ..., "params": [...]}, and datetimes both ways as
+    YYYY-MM-DDTHH:MM:SSZ strings, converted between local time and UTC
+    like XML-RPC ones.  Nothing else tells them apart from strings in
+    responses, so only the values of entity fields that field_types,
+    {entity_type: {field_name: data_type}}, says are date_time fields
+    are decoded as datetimes.  The server reports errors as
+    {"exception": true, "message": ...}, which is raised as a Fault.
+    The json module can only decode whole documents, so streamed
+    entities all arrive once the response has been read.
+    """
+    
+    content_type = "application/json"
+    path = "json"
+    datetime_format = "%04d-%02d-%02dT%02d:%02d:%02dZ"
+    
+    def __init__(self, encoding=None, use_datetime=1, convert_datetimes_to_utc=1, field_types=None):
+        if json is None:
+            raise ValueError, "the json module is not available"
+        self.encoding = encoding or "utf-8"
+        self.use_datetime = use_datetime
+        self.convert_datetimes_to_utc = convert_datetimes_to_utc
+        self.field_types = field_types
+    
+    def dumps(self, params, methodname):
+        return json.dumps({"method_name": methodname, "params": list(params)}, encoding=self.encoding,
+                          separators=(",", ":"), default=self._default)
+    
+    def _default(self, value):
+        # values the json module can't encode by itself
+        if isinstance(value, (datetime.datetime, datetime.time)):
+            value = _outgoing_datetime(value, self.convert_datetimes_to_utc)
+        elif isinstance(value, datetime.date):
+            value = datetime.datetime(value.year, value.month, value.day)
+        elif isinstance(value, DateTime):
+            value = _datetime_type(value.value)
+        else:
+            raise TypeError, "cannot marshal %s objects" % type(value)
+        return self.datetime_format % (value.year, value.month, value.day, value.hour, value.minute, value.second)
+    
+    def getparser(self, decode_memo=None, stream_entities=0):
+        target = JsonUnmarshaller(self.use_datetime, self.convert_datetimes_to_utc, decode_memo, stream_entities,
+                                  self.field_types)
+        return JsonParser(target), target
+
+class JsonParser:
+    # the json module can only decode a whole document, so this just
+    # hands the response to the unmarshaller as it arrives
+    def __init__(self, target):
+        self.feed = target.data
+    
+    def close(self):
+        pass
+
+class JsonUnmarshaller:
+    """Unmarshal a JSON response fed to it in pieces.  Call close() to
+    get the resulting data structure, in the same form the XML-RPC
+    unmarshallers give it: ascii strings as str, the values of date_time
+    fields in field_types as datetime objects (or DateTime with
+    use_datetime off), and strings and entity links shared through
+    decode_memo.  With stream_entities, the entities of a read response
+    are moved to the entities list.
+    """
+    
+    def __init__(self, use_datetime=1, convert_datetimes_to_utc=1, decode_memo=None, stream_entities=0,
+                 field_types=None):
+        self.entities = None
+        if stream_entities:
+            self.entities = []
+        self._chunks = []
+        self.data = self._chunks.append
+        self._use_datetime = use_datetime
+        self._convert_datetimes_to_utc = convert_datetimes_to_utc
+        self._field_types = field_types
+        self._memo = decode_memo
+        if decode_memo is not None:
+            self._strings = decode_memo.strings
+            self._share_link = decode_memo.share_link
+            self._max_string_length = decode_memo.max_string_length
+    
+    def close(self):
+        result = json.loads(string.join(self._chunks, ""), object_hook=self._object)
+        del self._chunks[:]
+        if self._memo is not None:
+            self._memo.trim()
+        if isinstance(result, DictType) and result.get("exception"):
+            raise Fault(result.get("error_code", 0), _stringify(result.get("message", "")))
+        if self.entities is not None and isinstance(result, DictType):
+            results = result.get("results")
+            if isinstance(results, DictType) and isinstance(results.get("entities"), ListType):
+                self.entities.extend(results["entities"])
+                results["entities"] = []
+        return (result,)
+    
+    def getmethodname(self):
+        return None
+    
+    def _object(self, obj):
+        # called by the json module with every object it decodes, innermost first
+        struct = {}
+        for key, value in obj.iteritems():
+            t = type(value)
+            if t is UnicodeType:
+                value = self._string(value)
+            elif t is ListType:
+                for i in range(len(value)):
+                    if type(value[i]) is UnicodeType:
+                        value[i] = self._string(value[i])
+            try:
+                key = key.encode("ascii")
+            except UnicodeError:
+                pass
+            if self._memo is not None:
+                key = self._strings.setdefault(key, key)
+            struct[key] = value
+        
+        if self._field_types:
+            self._datetimes(struct)
+        if self._memo is not None:
+            struct = self._share_link(struct)
+        return struct
+    
+    def _datetimes(self, struct):
+        # decode the values of an entity's date_time fields, going by the field types of its type
+        entity_type = struct.get("type")
+        if type(entity_type) is not StringType:
+            return
+        for key, value in struct.items():
+            if type(value) is StringType and len(value) == 20 and self._data_type(entity_type, key) == "date_time":
+                value = self._datetime(value)
+                if value is not None:
+                    struct[key] = value
+    
+    def _data_type(self, entity_type, field_name):
+        # linked field paths such as 'sg_sequence.Sequence.updated_at' have the type of their last field
+        parts = field_name.split(".")
+        if len(parts) >= 3:
+            entity_type, field_name = parts[-2], parts[-1]
+        return self._field_types.get(entity_type, {}).get(field_name)
+    
+    def _string(self, data):
+        try:
+            data = data.encode("ascii")
+        except UnicodeError:
+            pass
+        if self._memo is not None and len(data) <= self._max_string_length:
+            data = self._strings.setdefault(data, data)
+        return data
+    
+    def _datetime(self, data):
+        # YYYY-MM-DDTHH:MM:SSZ, or None if it's only a string that looks a bit like one
+        if data[4] != "-" or data[7] != "-" or data[10] != "T" or data[13] != ":" or data[16] != ":" or data[19] != "Z":
+            return None
+        try:
+            value = datetime.datetime(int(data[:4]), int(data[5:7]), int(data[8:10]),
+                                      int(data[11:13]), int(data[14:16]), int(data[17:19]))
+        except ValueError:
+            return None
+        if not self._use_datetime:
+            return DateTime(value)
+        if self._convert_datetimes_to_utc:
+            value = value.replace(tzinfo = sg_timezone.utc).astimezone(sg_timezone.local)
+        return value
+
 
 # --------------------------------------------------------------------
 # request dispatcher
@@ -2036,6 +5001,22 @@ class Transport:
         self._connection = (None, None)
         self._extra_headers = []
         self._convert_datetimes_to_utc = convert_datetimes_to_utc
+        self.response_size = 0
+        # share equal values within each response, and across responses when decode_memo is set
+        self.share_values = False
+        self.decode_memo = None
+        # send StreamingRequests with chunked transfer encoding rather than a precomputed length
+        self.chunked_requests = False
+        # turn off the cyclic garbage collector while responses are decoded
+        self.pause_gc = False
+        # the codec of the ServerProxy using this transport, which decodes the responses (XML-RPC if None)
+        self.codec = None
+        # ask for gzip or deflate compressed responses
+        self.accept_compressed = False
+        # gzip compress requests bigger than this many bytes, and all StreamingRequests (never if None)
+        self.compress_request_bytes = None
+        # the response stream_request is reading, while it hasn't been read to the end
+        self._unfinished = None
     
     ##
     # Send a complete request, and parse the response.
@@ -2048,15 +5029,18 @@ class Transport:
     # @return Parsed response.
     
     def request(self, host, handler, request_body, verbose=0):
-        #retry request once if cached connection has gone cold
+        return self._retry(self.single_request, host, handler, request_body, verbose)
+    
+    def _retry(self, send, host, handler, request_body, verbose):
+        #retry request if cached connection has gone cold
         for i in range(10):
             try:
-                return self.single_request(host, handler, request_body, verbose)
+                return send(host, handler, request_body, verbose)
             except socket.error, e:
-                if i >= 10 or e.errno not in (errno.ECONNRESET, errno.ECONNABORTED, errno.EPIPE):
+                if i >= 9 or e.errno not in (errno.ECONNRESET, errno.ECONNABORTED, errno.EPIPE):
                     raise
             except httplib.BadStatusLine: #close after we sent request
-                if i >= 10:
+                if i >= 9:
                     raise
     
     ##
@@ -2070,6 +5054,46 @@ class Transport:
     
     def single_request(self, host, handler, request_body, verbose=0):
         # issue XML-RPC request
+        response = self.open_request(host, handler, request_body, verbose)
+        try:
+            return self.parse_response(response)
+        except Fault:
+            raise
+        except Exception:
+            # All unexpected errors leave connection in
+            # a strange state, so we clear it.
+            self.close()
+            raise
+    
+    ##
+    # Send a read request, and return a generator yielding the entities
+    # of the response, a list at a time, as they're decoded.  Retry
+    # request if a cached connection has disconnected.
+    #
+    # @param host Target host.
+    # @param handler Target PRC handler.
+    # @param request_body XML-RPC request body.
+    # @param verbose Debugging flag.
+    # @return Generator of lists of entities.
+    
+    def stream_request(self, host, handler, request_body, verbose=0):
+        return self._iter_response(self._retry(self.open_request, host, handler, request_body, verbose))
+    
+    ##
+    # Send a request, and return the response once it's known to have
+    # succeeded.
+    #
+    # @param host Target host.
+    # @param handler Target PRC handler.
+    # @param request_body XML-RPC request body.
+    # @param verbose Debugging flag.
+    # @return HTTP response, ready to be read.
+    
+    def open_request(self, host, handler, request_body, verbose=0):
+        if self._unfinished is not None:
+            # the rest of a streamed response nobody read is still on its way
+            self._unfinished = None
+            self.close()
         h = self.make_connection(host)
         if verbose:
             h.set_debuglevel(1)
@@ -2083,9 +5107,7 @@ class Transport:
             response = h.getresponse()
             if response.status == 200:
                 self.verbose = verbose
-                return self.parse_response(response)
-        except Fault:
-            raise
+                return response
         except Exception:
             # All unexpected errors leave connection in
             # a strange state, so we clear it.
@@ -2106,9 +5128,15 @@ class Transport:
     #
     # @return A 2-tuple containing a parser and a unmarshaller.
     
-    def getparser(self):
+    def getparser(self, stream_entities=0):
         # get parser and unmarshaller
-        return getparser(use_datetime=self._use_datetime, convert_datetimes_to_utc=self._convert_datetimes_to_utc)
+        decode_memo = None
+        if self.share_values:
+            decode_memo = self.decode_memo or DecodeMemo()
+        if self.codec is not None:
+            return self.codec.getparser(decode_memo, stream_entities)
+        return getparser(use_datetime=self._use_datetime, convert_datetimes_to_utc=self._convert_datetimes_to_utc,
+                         decode_memo=decode_memo, stream_entities=stream_entities)
     
     ##
     # Get authorization info from host parameter
@@ -2210,7 +5238,28 @@ class Transport:
     # @param request_body XML-RPC request body.
     
     def send_content(self, connection, request_body):
-        connection.putheader("Content-Type", "text/xml")
+        connection.putheader("Content-Type", self.codec and self.codec.content_type or "text/xml")
+        if self.accept_compressed:
+            connection.putheader("Accept-Encoding", "gzip, deflate")
+        compress = 0
+        if self.compress_request_bytes:
+            if isinstance(request_body, StreamingRequest):
+                connection.putheader("Content-Encoding", "gzip")
+                compress = 1
+                if not self.chunked_requests:
+                    # the length has to be known up front, and compressed it's small enough to hold on to
+                    request_body = request_body.compress()
+            elif len(request_body) > self.compress_request_bytes:
+                connection.putheader("Content-Encoding", "gzip")
+                request_body = _gzip(request_body)
+        if isinstance(request_body, StreamingRequest):
+            if self.chunked_requests:
+                connection.putheader("Transfer-Encoding", "chunked")
+            else:
+                connection.putheader("Content-Length", str(request_body.size()))
+            connection.endheaders()
+            request_body.send(connection, self.chunked_requests, compress)
+            return
         connection.putheader("Content-Length", str(len(request_body)))
         connection.endheaders()
         if request_body:
@@ -2236,26 +5285,87 @@ class Transport:
     #    could not be accessed).
     # @return Response tuple and target method.
     
+    # bytes read from the response at a time
+    read_size = 64 * 1024
+    
     def _parse_response(self, file, sock):
         # read response from input file/socket, and parse it
         
         p, u = self.getparser()
         
+        # decoding creates lots of containers, none of them garbage, which would set off the collector over and
+        # over.  It's only turned back on if it was on to begin with.
+        pause_gc = self.pause_gc and gc.isenabled()
+        if pause_gc:
+            gc.disable()
+        try:
+            for response in self._read_response(file, sock):
+                p.feed(response)
+            p.close()
+            
+            return u.close()
+        finally:
+            if pause_gc:
+                gc.enable()
+    
+    def _read_response(self, file, sock=None):
+        # generator of the pieces of the response body as they're read, decompressed if need be, which adds up
+        # their size in response_size and closes the file once it has been read to the end
+        decompressor = self._decompressor(file)
+        self.response_size = 0
         while 1:
             if sock:
-                response = sock.recv(1024)
+                response = sock.recv(self.read_size)
             else:
-                response = file.read(1024)
+                response = file.read(self.read_size)
             if not response:
                 break
             if self.verbose:
                 print "body:", repr(response)
-            p.feed(response)
+            if decompressor:
+                response = decompressor.decompress(response)
+            self.response_size += len(response)
+            yield response
         
+        if decompressor:
+            response = decompressor.flush()
+            self.response_size += len(response)
+            yield response
         file.close()
-        p.close()
-        
-        return u.close()
+    
+    def _decompressor(self, file):
+        # compressed responses are decompressed a piece at a time on their way to the parser
+        if hasattr(file, "getheader"):
+            encoding = string.lower(file.getheader("content-encoding", ""))
+            if encoding in ("gzip", "x-gzip", "deflate"):
+                return _Decompressor(encoding)
+        return None
+    
+    def _iter_response(self, file):
+        # the generator stream_request returns.  The garbage collector
+        # isn't paused, as the caller's code runs between entities.
+        p, u = self.getparser(stream_entities=1)
+        entities = u.entities
+        self._unfinished = file
+        try:
+            for response in self._read_response(file):
+                p.feed(response)
+                if entities:
+                    decoded = entities[:]
+                    del entities[:]
+                    yield decoded
+            p.close()
+            u.close()
+        except Fault:
+            self._unfinished = None
+            raise
+        except Exception:
+            self._unfinished = None
+            self.close()
+            raise
+        self._unfinished = None
+        if entities:
+            yield entities
 
 ##
 # Standard transport class for XML-RPC over HTTPS.
@@ -2357,13 +5467,20 @@ class ServerProxy:
         
         transport: a transport factory
         encoding: the request encoding (default is UTF-8)
+        check_recursion: false to skip checking the parameters for
+            lists and dicts that contain themselves
+        stream_request_bytes: requests bigger than this many bytes are
+            sent as StreamingRequests
+        codec: encodes the requests and decodes the responses (by
+            default an XmlRpcCodec made with the options above)
     
     All 8-bit strings passed to the server proxy are assumed to use
     the given encoding.
     """
     
     def __init__(self, uri, transport=None, encoding=None, verbose=0,
-                 allow_none=1, use_datetime=1, convert_datetimes_to_utc=1):
+                 allow_none=1, use_datetime=1, convert_datetimes_to_utc=1, check_recursion=1,
+                 stream_request_bytes=None, codec=None):
         # establish a "logical" server connection
         
         # get the url
@@ -2382,19 +5499,27 @@ class ServerProxy:
                 transport = Transport(use_datetime=use_datetime, convert_datetimes_to_utc=convert_datetimes_to_utc)
         self.__transport = transport
         
-        self.__encoding = encoding
+        if codec is None:
+            codec = XmlRpcCodec(encoding, allow_none, use_datetime, convert_datetimes_to_utc, check_recursion,
+                                stream_request_bytes)
+        self.__codec = codec
+        transport.codec = codec
+        
         self.__verbose = verbose
-        self.__allow_none = allow_none
-        self.__convert_datetimes_to_utc = convert_datetimes_to_utc
     
     def __close(self):
         self.__transport.close()
     
+    def __stream(self, methodname, params):
+        # call a method that reads entities, and return a generator
+        # yielding them in lists as they're decoded
+        request = self.__codec.dumps(params, methodname)
+        return self.__transport.stream_request(self.__host, self.__handler, request, verbose=self.__verbose)
+    
     def __request(self, methodname, params):
         # call a method on the remote server
         
-        request = dumps(params, methodname, encoding=self.__encoding,
-                        allow_none=self.__allow_none, convert_datetimes_to_utc=self.__convert_datetimes_to_utc)
+        request = self.__codec.dumps(params, methodname)
         
         response = self.__transport.request(
             self.__host,
@@ -2429,6 +5554,8 @@ class ServerProxy:
         """
         if attr == "close":
             return self.__close
+        elif attr == "stream":
+            return self.__stream
         elif attr == "transport":
             return self.__transport
         raise AttributeError("Attribute %r not found" % (attr,))
@@ -0,0 +1,109 @@
+"""
+Round trips through the JSON codec against a minimal local stand-in for the /api3/json endpoint.
+
+    python tests/test_json_codec.py
+"""
+import datetime
+import os
+import sys
+import threading
+import time
+import unittest
+import BaseHTTPServer
+import SocketServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import shotgun_api3
+from shotgun_api3 import json
+
+SHOTS = [{"type": "Shot", "id": i, "code": "shot_%03d" % i} for i in range(1, 8)]
+SHOT_SCHEMA = {"code": {"data_type": {"value": "text"}}, "updated_at": {"data_type": {"value": "date_time"}}}
+
+class StubHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    # answers the methods the tests call, and remembers every request.  Connections are closed after every
+    # response, so none are left waiting when the tests finish.
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["content-length"])))
+        self.server.requests.append(request)
+        try:
+            body = {"results": getattr(self, "api_" + request["method_name"])(*request["params"][1:])}
+        except Exception, e:
+            body = {"exception": True, "message": str(e)}
+        body = json.dumps(body)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def api_info(self):
+        return {"version": [2, 4, 0]}
+
+    def api_schema_field_read(self, req):
+        return SHOT_SCHEMA
+
+    def api_read(self, req):
+        if req["type"] != "Shot":
+            raise ValueError("Unknown entity type %s" % req["type"])
+        per_page = req["paging"]["entities_per_page"]
+        start = (req["paging"]["current_page"] - 1) * per_page
+        return {"entities": SHOTS[start:start + per_page], "paging_info": {"entity_count": len(SHOTS)}}
+
+    def api_create(self, req):
+        record = {"type": req["type"], "id": 100}
+        for field in req["fields"]:
+            record[field["field_name"]] = field["value"]
+        return record
+
+class StubServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+class JsonCodecTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = StubServer(("127.0.0.1", 0), StubHandler)
+        self.server.requests = []
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.setDaemon(True)
+        thread.start()
+
+        class Shotgun(shotgun_api3.Shotgun):
+            records_per_page = 3
+            schema_cache_dir = False
+        self.sg = Shotgun("http://127.0.0.1:%d" % self.server.server_address[1], "script", "key",
+                          wire_format="json")
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_datetime_round_trip(self):
+        local = datetime.datetime(2011, 3, 4, 5, 6, 7)
+        record = self.sg.create("Shot", {"code": "x", "updated_at": local})
+
+        sent = self.server.requests[-1]["params"][1]["fields"]
+        utc = datetime.datetime.utcfromtimestamp(time.mktime(local.timetuple()))
+        self.assertTrue({"field_name": "updated_at", "value": utc.strftime("%Y-%m-%dT%H:%M:%SZ")} in sent)
+        self.assertEqual(record["updated_at"].tzinfo, shotgun_api3.sg_timezone.local)
+        self.assertEqual(record["updated_at"].replace(tzinfo=None), local)
+        self.assertEqual(type(record["code"]), str)
+
+    def test_datetime_text(self):
+        # only date_time fields are decoded as datetimes, whatever text fields hold
+        record = self.sg.create("Shot", {"code": "2011-03-04T05:06:07Z"})
+        self.assertEqual(record["code"], "2011-03-04T05:06:07Z")
+
+    def test_fault(self):
+        self.assertRaises(shotgun_api3.Fault, self.sg.find, "Nope", [], ["code"])
+
+    def test_read_paging(self):
+        self.assertEqual(self.sg.find("Shot", [], ["code"]), SHOTS)
+        self.assertEqual(list(self.sg.find_iter("Shot", [], ["code"])), SHOTS)
+        self.assertEqual(list(self.sg.find_iter("Shot", [], ["code"], stream_entities=True)), SHOTS)
+        self.assertEqual(self.sg.find("Shot", [], ["code"], limit=4), SHOTS[:4])
+
+if __name__ == "__main__":
+    unittest.main()